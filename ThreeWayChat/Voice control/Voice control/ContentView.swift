@@ -800,6 +800,21 @@ struct ContentView: View {
                                     }
                                 }
                                 
+                            } else if messageData["type"] as? String == "busy" {
+                                // The server shed this message; stop waiting and say so
+                                self.isGrokThinking = false
+                                self.isCursorThinking = false
+                                if let content = messageData["content"] as? String {
+                                    self.messages.append(Message(
+                                        sender: "system",
+                                        content: content,
+                                        messageType: "text",
+                                        timestamp: messageData["timestamp"] as? String ?? ""
+                                    ))
+                                    self.stopContinuousListening()
+                                    self.speakGrokResponse(content)
+                                }
+                                
                             } else if let sender = messageData["sender"] as? String,
                                       let content = messageData["content"] as? String {
                                 
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Redis pub/sub
+Speaks just enough RESP (SUBSCRIBE, PUBLISH, PING) for cloud_server.py's
+RedisBackplane, so several workers can share state without a Redis install:
+
+    python backplane_hub.py --unix /tmp/threewaychat.sock
+    BACKPLANE_URL=unix:///tmp/threewaychat.sock THREEWAYCHAT_WORKERS=4 python cloud_server.py
+"""
+
+import argparse
+import asyncio
+import os
+from collections import defaultdict
+
+subscribers = defaultdict(set)  # channel -> StreamWriters
+stats = {"published": 0, "delivered": 0, "clients": 0}
+
+
+def bulk(value: str) -> bytes:
+    data = value.encode()
+    return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+
+def array(*items: str) -> bytes:
+    return f"*{len(items)}\r\n".encode() + b"".join(bulk(item) for item in items)
+
+
+async def read_command(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.decode().split()  # Inline command, e.g. from redis-cli or telnet
+    parts = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        parts.append((await reader.readexactly(size + 2))[:-2].decode())
+    return parts
+
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    stats["clients"] += 1
+    channels = set()
+    try:
+        while True:
+            command = await read_command(reader)
+            if command is None:
+                break
+            if not command:
+                continue
+            name = command[0].upper()
+            if name == "SUBSCRIBE":
+                for channel in command[1:]:
+                    channels.add(channel)
+                    subscribers[channel].add(writer)
+                    writer.write(b"*3\r\n" + bulk("subscribe") + bulk(channel) + f":{len(channels)}\r\n".encode())
+            elif name == "PUBLISH" and len(command) == 3:
+                _, channel, message = command
+                listeners = list(subscribers.get(channel, ()))
+                frame = array("message", channel, message)
+                for listener in listeners:
+                    listener.write(frame)
+                stats["published"] += 1
+                stats["delivered"] += len(listeners)
+                writer.write(f":{len(listeners)}\r\n".encode())
+            elif name == "PING":
+                writer.write(b"+PONG\r\n")
+            elif name == "QUIT":
+                writer.write(b"+OK\r\n")
+                break
+            else:
+                writer.write(f"-ERR unsupported command '{command[0]}'\r\n".encode())
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        for channel in channels:
+            subscribers[channel].discard(writer)
+        stats["clients"] -= 1
+        writer.close()
+
+
+async def main(args):
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.unlink(args.unix)
+        server = await asyncio.start_unix_server(handle_client, path=args.unix)
+        where = f"unix://{args.unix}"
+    else:
+        server = await asyncio.start_server(handle_client, args.host, args.port)
+        where = f"redis://{args.host}:{args.port}"
+    print(f"🛰️ Backplane hub on {where}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal Redis pub/sub stand-in for the cloud_server backplane")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--unix", help="Listen on this Unix socket instead of TCP")
+    asyncio.run(main(parser.parse_args()))
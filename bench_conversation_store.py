@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the durable conversation log in cloud_server.py
+Measures how many appends per second the group-committed SQLite writer sustains
+and how long append() holds up the caller (the event loop in production).
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from cloud_server import ConversationStore, KnowledgeEntry
+
+
+def run(count: int, batch_size: int, content_size: int, sessions: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ConversationStore(os.path.join(tmp, "bench.db"), batch_size=batch_size)
+        store.start()
+        content = "x" * content_size
+        now = time.time()
+        entries = [KnowledgeEntry(i, "phone" if i % 2 else "grok", content, "text", now) for i in range(count)]
+
+        start = time.perf_counter()
+        for i, entry in enumerate(entries):
+            store.append(f"session-{i % sessions}", entry)
+        enqueue_seconds = time.perf_counter() - start
+
+        store.close()
+        total_seconds = time.perf_counter() - start
+
+        return {
+            "rows": count,
+            "batch_size": batch_size,
+            "content_bytes": content_size,
+            "batches": store.batches,
+            "enqueue_us_per_append": round(enqueue_seconds / count * 1e6, 2),
+            "appends_per_second": round(count / total_seconds),
+            "total_seconds": round(total_seconds, 3)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation store append throughput")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--content-size", type=int, default=200)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--batch-sizes", default="1,32,256,1024")
+    args = parser.parse_args()
+
+    print("💾 Conversation store append benchmark")
+    print("=" * 40)
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        result = run(args.count, batch_size, args.content_size, args.sessions)
+        print(f"batch {batch_size:>5}: {result['appends_per_second']:>8} appends/s, "
+              f"{result['enqueue_us_per_append']} µs/append on caller, {result['batches']} commits")
+
+
+if __name__ == "__main__":
+    main()
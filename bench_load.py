@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Load generator for the cloud_server.py WebSocket endpoints
+Simulates N phone clients and M Cursor clients against a running server:
+phones speak, wait for Grok's reply and think before the next utterance;
+Cursor clients answer Grok's CURSOR_QUERY round-trips and can send their own
+programming questions. Prints a JSON report (throughput, p50/p95/p99
+latencies, time-to-first-frame, error rates) to compare runs across releases.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict
+
+import websockets
+
+MESSAGES = {
+    "chat": [
+        "What's a good way to plan the rest of my afternoon?",
+        "Tell me something interesting about deep sea creatures",
+        "How long should I let bread dough rise?",
+        "Give me a quick summary of what we talked about earlier",
+    ],
+    "programming": [
+        "Why does my python function return None instead of the list?",
+        "How do I fix this javascript undefined error in the API handler?",
+        "What's the best way to debug a slow database query in the backend?",
+        "Explain why this swift class leaks memory when the view closes",
+    ],
+    "cursor_query": [
+        "Can you ask cursor what the current build error is?",
+        "Please ask cursor which tests are failing in the companion app",
+        "Ask cursor to check the server logs for the last error",
+    ],
+}
+
+CURSOR_MESSAGES = [
+    "Here's the handler:\n```python\ndef load(items):\n    for item in items:\n        process(item)\n```\nWhy does it return None?",
+    "This javascript function throws an error when the api returns an empty list, how do I fix it?",
+]
+
+FAILURE_PREFIXES = ("Sorry, there was an error", "Sorry, I couldn't generate")
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in MESSAGES:
+            raise SystemExit(f"Unknown message kind {name!r}; choose from {', '.join(MESSAGES)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 1)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 1),
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "max": round(ordered[-1] * 1000, 1),
+    }
+
+
+class Results:
+    def __init__(self):
+        self.e2e = defaultdict(list)
+        self.first_frame = []
+        self.first_content = []
+        self.errors = Counter()
+        self.turns_started = 0
+        self.turns_completed = 0
+        self.frames_received = 0
+        self.queries_answered = 0
+
+
+async def receive_json(ws, timeout: float) -> dict:
+    return json.loads(await asyncio.wait_for(ws.recv(), timeout))
+
+
+async def phone_client(index: int, args, mix: dict, results: Results, deadline: float):
+    rng = random.Random(args.seed + index)
+    url = f"{args.url}/ws/phone?session={args.session_prefix}-{index}"
+    try:
+        ws = await websockets.connect(url, open_timeout=10, max_size=None)
+    except Exception:
+        results.errors["connect"] += 1
+        return
+
+    try:
+        await receive_json(ws, 10)  # Connection banner
+        await asyncio.sleep(rng.uniform(0, args.think_time))  # Don't start in lockstep
+        while time.monotonic() < deadline:
+            kind = rng.choices(list(mix), weights=list(mix.values()))[0]
+            content = rng.choice(MESSAGES[kind])
+            if args.speech_rate > 0:
+                await asyncio.sleep(len(content.split()) / args.speech_rate)
+
+            results.turns_started += 1
+            started = time.perf_counter()
+            await ws.send(json.dumps({
+                "type": "text", "content": content, "stream": args.stream, "cache": args.cache
+            }))
+            first_frame = first_content = None
+            turn_deadline = started + args.turn_timeout
+            while True:
+                remaining = turn_deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                frame = await receive_json(ws, remaining)
+                now = time.perf_counter()
+                results.frames_received += 1
+                if first_frame is None:
+                    first_frame = now - started
+                if frame.get("type") == "busy":
+                    break
+                if frame.get("sender") != "grok":
+                    continue
+                if first_content is None and frame.get("type") in ("message", "message_chunk"):
+                    first_content = now - started
+                if frame.get("type") in ("message", "message_end"):
+                    break
+
+            results.first_frame.append(first_frame)
+            results.first_content.append(first_content)
+            if frame.get("type") == "busy":
+                results.errors["busy"] += 1
+            elif frame.get("content", "").startswith(FAILURE_PREFIXES):
+                results.errors["upstream"] += 1
+            else:
+                results.turns_completed += 1
+                results.e2e[kind].append(now - started)
+            await asyncio.sleep(rng.expovariate(1 / args.think_time) if args.think_time > 0 else 0)
+    except asyncio.TimeoutError:
+        results.errors["timeout"] += 1
+    except websockets.ConnectionClosed:
+        results.errors["disconnect"] += 1
+    finally:
+        await ws.close()
+
+
+async def cursor_client(index: int, args, results: Results, deadline: float):
+    rng = random.Random(args.seed + 10_000 + index)
+    url = f"{args.url}/ws/cursor?session={args.session_prefix}-{index}"
+    try:
+        ws = await websockets.connect(url, open_timeout=10, max_size=None)
+    except Exception:
+        results.errors["connect"] += 1
+        return
+
+    pending_reply = None  # (future, started) for our own programming question
+
+    async def answer(query: dict):
+        await asyncio.sleep(rng.uniform(0.5, 1.5) * args.cursor_reply_time)
+        await ws.send(json.dumps({
+            "type": "text", "reply_to": query.get("query_id"),
+            "content": f"Cursor checked: {query.get('content', '')[:80]} - the last build passed."
+        }))
+        results.queries_answered += 1
+
+    async def reader():
+        nonlocal pending_reply
+        async for raw in ws:
+            frame = json.loads(raw)
+            results.frames_received += 1
+            if frame.get("type") == "query":
+                asyncio.create_task(answer(frame))
+            elif pending_reply and (frame.get("type") == "busy" or (
+                    frame.get("sender") == "grok" and frame.get("type") == "message")):
+                future, _ = pending_reply
+                if not future.done():
+                    future.set_result(frame)
+
+    reading = asyncio.create_task(reader())
+    try:
+        while args.cursor_interval > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(rng.expovariate(1 / args.cursor_interval))
+            if time.monotonic() >= deadline:
+                break
+            results.turns_started += 1
+            started = time.perf_counter()
+            pending_reply = (asyncio.get_running_loop().create_future(), started)
+            await ws.send(json.dumps({"type": "text", "content": rng.choice(CURSOR_MESSAGES)}))
+            try:
+                frame = await asyncio.wait_for(pending_reply[0], args.turn_timeout)
+            except asyncio.TimeoutError:
+                results.errors["timeout"] += 1
+                continue
+            if frame.get("type") == "busy":
+                results.errors["busy"] += 1
+            elif frame.get("content", "").startswith(FAILURE_PREFIXES):
+                results.errors["upstream"] += 1
+            else:
+                results.turns_completed += 1
+                results.e2e["cursor_programming"].append(time.perf_counter() - started)
+        await asyncio.sleep(max(deadline - time.monotonic(), 0) + args.turn_timeout)
+    finally:
+        reading.cancel()
+        await ws.close()
+
+
+async def run(args) -> dict:
+    mix = parse_mix(args.mix)
+    results = Results()
+    started = time.monotonic()
+    deadline = started + args.duration
+    phones = [phone_client(i, args, mix, results, deadline) for i in range(args.phones)]
+    cursors = [asyncio.create_task(cursor_client(i, args, results, deadline)) for i in range(args.cursors)]
+    await asyncio.sleep(0.2)  # Let Cursor clients attach before phones start asking for them
+    await asyncio.gather(*phones)
+    for task in cursors:
+        task.cancel()
+    await asyncio.gather(*cursors, return_exceptions=True)
+    elapsed = time.monotonic() - started
+
+    all_e2e = [value for values in results.e2e.values() for value in values]
+    failed = sum(count for kind, count in results.errors.items() if kind != "connect")
+    return {
+        "config": {
+            "url": args.url, "phones": args.phones, "cursors": args.cursors, "duration_s": args.duration,
+            "mix": mix, "stream": args.stream, "cache": args.cache, "think_time_s": args.think_time,
+            "speech_rate_wps": args.speech_rate, "cursor_interval_s": args.cursor_interval,
+        },
+        "elapsed_s": round(elapsed, 2),
+        "turns": {"started": results.turns_started, "completed": results.turns_completed},
+        "throughput_turns_per_s": round(results.turns_completed / elapsed, 2),
+        "frames_per_s": round(results.frames_received / elapsed, 1),
+        "cursor_queries_answered": results.queries_answered,
+        "latency_ms": {
+            "end_to_end": percentiles(all_e2e),
+            "first_frame": percentiles(results.first_frame),
+            "first_content": percentiles([v for v in results.first_content if v is not None]),
+            "by_kind": {kind: percentiles(values) for kind, values in sorted(results.e2e.items())},
+        },
+        "errors": dict(results.errors),
+        "error_rate": round(failed / results.turns_started, 4) if results.turns_started else None,
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="WebSocket load generator for cloud_server.py")
+    parser.add_argument("--url", default="ws://localhost:5000", help="Server base URL")
+    parser.add_argument("--phones", type=int, default=20, help="Concurrent phone clients")
+    parser.add_argument("--cursors", type=int, default=20, help="Cursor clients (sessions 0..M-1)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to keep starting turns")
+    parser.add_argument("--mix", default="chat=5,programming=4,cursor_query=1",
+                        help="Weighted phone message kinds")
+    parser.add_argument("--think-time", type=float, default=2.0, help="Mean pause between turns (s)")
+    parser.add_argument("--speech-rate", type=float, default=2.5,
+                        help="Words per second spoken before each utterance is sent (0 = none)")
+    parser.add_argument("--cursor-interval", type=float, default=0,
+                        help="Mean seconds between Cursor-originated questions (0 = only answer queries)")
+    parser.add_argument("--cursor-reply-time", type=float, default=0.5, help="Mean Cursor answer delay (s)")
+    parser.add_argument("--turn-timeout", type=float, default=60)
+    parser.add_argument("--stream", action="store_true", help="Ask for streamed replies")
+    parser.add_argument("--cache", action="store_true", help="Allow cached Grok replies")
+    parser.add_argument("--session-prefix", default="load")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Also write the JSON report here")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+
+    print("🚦 WebSocket load test")
+    print("=" * 40)
+    print(f"{args.phones} phones, {args.cursors} cursors, {args.duration:g}s against {args.url}")
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
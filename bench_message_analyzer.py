@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark for analyze_message in cloud_server.py
+Compares the single-pass compiled analyzer with the separate keyword scans it
+replaced, on short voice turns and on long Cursor code messages.
+"""
+
+import argparse
+import random
+import timeit
+
+from cloud_server import analyze_message
+
+# The scans update_conversation_context, update_extended_memory and
+# is_programming_question used to run on every message
+LEGACY_LISTS = [
+    ['debug', 'error', 'undefined', 'bug', 'fix'],
+    ['code', 'function', 'javascript', 'python', 'programming'],
+    ['how', 'what', 'why', 'explain'],
+    ['error', 'bug', 'issue', 'problem', 'broken'],
+    ['fixed', 'solved', 'working', 'resolved', 'success'],
+    ["code", "program", "function", "class", "bug", "error", "debug",
+     "python", "javascript", "swift", "java", "c++", "sql", "api",
+     "algorithm", "data structure", "framework", "library", "git",
+     "deploy", "server", "database", "frontend", "backend", "fullstack"],
+]
+
+
+def legacy_analyze(content: str):
+    found = []
+    for words in LEGACY_LISTS:
+        content_lower = content.lower()
+        found.append(any(word in content_lower for word in words))
+    content_lower = content.lower()
+    if 'companion app' in content_lower:
+        found.append('api' in content_lower or any(e in content_lower for e in ['health', 'contacts', 'analytics', 'sales']))
+    keywords = [word.lower() for word in content.split()
+                if len(word) > 4 and word.lower() not in ['this', 'that', 'with', 'have', 'will', 'from', 'they']]
+    return found, keywords[:3]
+
+
+def make_code_message(lines: int) -> str:
+    random.seed(7)
+    body = []
+    for i in range(lines):
+        body.append(random.choice([
+            f"    const value{i} = await fetchData(url, {{ retries: {i % 5} }});",
+            f"    if (!response.ok) throw new Error('Request {i} failed');",
+            f"    logger.info(`processed item ${{item.id}} in ${{elapsed}}ms`);",
+            f"    return items.filter(x => x.score > {i}).map(x => x.name);",
+        ]))
+    return "Here is the updated handler:\n```javascript\nasync function handler(req) {\n" + "\n".join(body) + "\n}\n```"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Message analyzer throughput")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    samples = {
+        "voice turn": "Hey can you check why the companion app health endpoint is broken?",
+        "cursor 200 lines": make_code_message(200),
+        "cursor 2000 lines": make_code_message(2000),
+    }
+
+    print("🔎 Message analyzer benchmark")
+    print("=" * 40)
+    for name, content in samples.items():
+        number = max(args.number // max(len(content) // 2000, 1), 10)
+        legacy = timeit.timeit(lambda: legacy_analyze(content), number=number) / number
+        single = timeit.timeit(lambda: analyze_message(content), number=number) / number
+        print(f"{name:>18} ({len(content):>7} chars): legacy {legacy * 1e6:9.1f} µs, "
+              f"single-pass {single * 1e6:9.1f} µs ({legacy / single:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark for outbound frame encoding in cloud_server.py
+Compares encoding a frame per recipient with the stdlib encoder against
+encoding it once with OutboundFrame, plus the pre-encoded static frames.
+"""
+
+import argparse
+import json
+import timeit
+
+from cloud_server import THINKING_FRAME, OutboundFrame, encode_json, orjson
+
+
+def make_response(chars: int) -> dict:
+    sentence = "The handler retries the request with exponential backoff and logs each failure. "
+    return {
+        "type": "message",
+        "sender": "grok",
+        "content": (sentence * (chars // len(sentence) + 1))[:chars],
+        "timestamp": "2026-10-17T12:00:00.000000",
+        "stream_id": "3f2a9c1e-5b7d-4e8f-9a0b-1c2d3e4f5a6b",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outbound frame encoding throughput")
+    parser.add_argument("--number", type=int, default=5000)
+    parser.add_argument("--recipients", type=int, default=4)
+    args = parser.parse_args()
+
+    print("📦 Outbound frame benchmark")
+    print("=" * 40)
+    print(f"encoder: {'orjson ' + orjson.__version__ if orjson else 'stdlib json'}, "
+          f"{args.recipients} recipients per fan-out")
+
+    for chars in (200, 4000, 40000):
+        payload = make_response(chars)
+        number = max(args.number * 200 // chars, 50)
+        stdlib = timeit.timeit(lambda: json.dumps(payload), number=number) / number
+        fast = timeit.timeit(lambda: encode_json(payload), number=number) / number
+        per_recipient = timeit.timeit(
+            lambda: [json.dumps(payload) for _ in range(args.recipients)], number=number) / number
+
+        def encode_once():
+            frame = OutboundFrame(payload)
+            return [frame.text for _ in range(args.recipients)]
+
+        once = timeit.timeit(encode_once, number=number) / number
+        print(f"{chars:>6} chars: json.dumps {stdlib * 1e6:8.1f} µs, encode_json {fast * 1e6:8.1f} µs/frame | "
+              f"fan-out {1 / per_recipient:9.0f} -> {1 / once:9.0f} fan-outs/s ({per_recipient / once:.1f}x)")
+
+    number = args.number * 10
+    dynamic = timeit.timeit(lambda: json.dumps(
+        {"type": "system", "content": "Grok is thinking...", "timestamp": "2026-10-17T12:00:00.000000"}),
+        number=number) / number
+    static = timeit.timeit(lambda: THINKING_FRAME.render("2026-10-17T12:00:00.000000").text,
+                           number=number) / number
+    print(f"status frame: json.dumps {dynamic * 1e6:.2f} µs, pre-encoded {static * 1e6:.2f} µs "
+          f"({dynamic / static:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for Session.get_smart_context_for_grok in cloud_server.py
+Reports the per-call cost when nothing changed since the last call (cache hit)
+and when the dynamic suffix has to be rebuilt (a new message arrived), against
+the old build of the whole prompt on every call.
+"""
+
+import argparse
+import timeit
+
+from cloud_server import Message, Session
+
+
+def make_session() -> Session:
+    session = Session("bench")
+    for i in range(20):
+        session.add_to_knowledge_base(Message(
+            sender="phone" if i % 2 == 0 else "cursor",
+            content=f"please debug the websocket error number {i} in the handler function?",
+            timestamp=session.get_timestamp()
+        ))
+    return session
+
+
+# The per-turn prompt build get_smart_context_for_grok replaced, kept as the baseline
+def legacy_smart_context(session: Session) -> str:
+    """get_smart_context_for_grok as it was before caching: the whole prompt, every call"""
+    ctx = session.conversation_context
+    
+    context_parts = [
+        "You are Grok in a three-way conversation with a user (phone) and Cursor AI (coding assistant).",
+        "\n=== COMPLETE PROJECT ECOSYSTEM ===",
+        
+        "🎯 **ThreeWayChat App** (Current App):",
+        "- Voice-controlled iOS app with Swift/SwiftUI",
+        "- Real-time WebSocket communication via FastAPI server on Render",
+        "- Speech-to-text (SFSpeechRecognizer) and text-to-speech (AVSpeechSynthesizer)",
+        "- Voice Activity Detection (VAD) with automatic restart after responses",
+        "- Anti-feedback loop protection (headset mode)",
+        "- Smart context system for efficient conversation history",
+        "- Project switching capabilities between multiple programs",
+        "- Files: ContentView.swift, cloud_server.py, real_cursor_integration.js",
+        "- Server: voice-chat-app-cc40.onrender.com (FastAPI + WebSockets)",
+        
+        "🏢 **Big Beautiful Program** (Main Application):",
+        "- Primary business application with its own API server",
+        "- Has dedicated API endpoints and authentication system",
+        "- Integrated via voice commands through ThreeWayChat",
+        "- Can execute functions remotely via API calls",
+        "- Currently configurable in cursor integration",
+        
+        "📱 **Companion App** (Business Tool):",
+        "- Business management application on localhost:5001",
+        "- API Key: X authentication (xai-wQ6qJGFoJT8GSwJ7Uht3vYzVzDWNw1i7EewqHkVNRpJcgNkcGDZYQa8w9OjhMPJMaZZEg9Cqm4IqF3mJQ)",
+        "- Endpoints: /api/health, /api/contacts, /api/analytics",
+        "- Sales tracking: /api/rolling-sales, /api/rolling-sales/export",
+        "- Location services: /api/geocode, /api/att-fiber-check",
+        "- Data management: /api/sync, POST /api/contacts",
+        "- Full voice control via 'Switch to Companion App' command",
+        
+        "🔧 **Technical Architecture**:",
+        "- Cursor AI Integration: real_cursor_integration.js (Node.js WebSocket client)",
+        "- AI Models: Grok-4 (1000 tokens), Cursor AI (programming help)",
+        "- Voice Flow: Phone → Server → Grok/Cursor → Phone",
+        "- Project Management: Voice switching between all three programs",
+        "- API Integration: RESTful calls with formatted responses",
+        "- Smart Context: Conversation-aware, token-efficient system"
+    ]
+    
+    # Add conversation type context
+    if ctx["conversation_type"] == "debugging":
+        context_parts.append("\n🐛 **Current Session**: Debugging - Help solve code issues across any project.")
+    elif ctx["conversation_type"] == "coding":
+        context_parts.append("\n💻 **Current Session**: Coding - Provide programming guidance for any project.")
+    elif ctx["conversation_type"] == "explanation":
+        context_parts.append("\n📚 **Current Session**: Explanation - Help clarify concepts across the ecosystem.")
+    
+    # Add user's current question if available
+    if ctx["user_question"]:
+        context_parts.append(f"\n❓ **User Question**: {ctx['user_question']}")
+    
+    # Add what Cursor already said to avoid repetition
+    if ctx["cursor_last_response"]:
+        context_parts.append(f"\n🤖 **Cursor Response**: {ctx['cursor_last_response'][:300]}...")
+        context_parts.append("Build on or complement Cursor's response, don't repeat it.")
+    
+    # Add key topics
+    if ctx["key_points"]:
+        recent_topics = list(set(ctx["key_points"][-5:]))  # Last 5 unique keywords
+        context_parts.append(f"\n🔑 **Key Points**: {', '.join(recent_topics)}")
+    
+    context_parts.append("\n\n🎯 **Your Role**: Provide contextual help understanding the full ecosystem. Reference specific projects, APIs, and technical details when relevant.")
+    
+    # Add extended memory context
+    if session.extended_memory["technical_context"]["active_debugging"]:
+        context_parts.append(f"\n🔧 **Active Debug**: {session.extended_memory['technical_context']['active_debugging']}")
+    
+    if session.extended_memory["technical_context"]["recent_errors"]:
+        recent_errors = session.extended_memory["technical_context"]["recent_errors"][-2:]  # Last 2 errors
+        context_parts.append(f"\n⚠️ **Recent Issues**: {'; '.join(recent_errors)}")
+    
+    if session.extended_memory["technical_context"]["solved_problems"]:
+        solved = session.extended_memory["technical_context"]["solved_problems"][-2:]  # Last 2 solutions
+        context_parts.append(f"\n✅ **Recently Solved**: {'; '.join(solved)}")
+    
+    return " ".join(context_parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart context build cost")
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    session = make_session()
+
+    legacy = timeit.timeit(lambda: legacy_smart_context(session), number=args.number) / args.number
+    cached = timeit.timeit(session.get_smart_context_for_grok, number=args.number) / args.number
+
+    def rebuild():
+        session.context_version += 1
+        return session.get_smart_context_for_grok()
+
+    rebuilt = timeit.timeit(rebuild, number=args.number) / args.number
+
+    print("🧠 Smart context microbenchmark")
+    print("=" * 40)
+    print(f"prompt length:        {len(session.get_smart_context_for_grok())} chars")
+    print(f"legacy, every call:   {legacy * 1e6:.3f} µs/call")
+    print(f"cache hit:            {cached * 1e6:.3f} µs/call  ({legacy / cached:.0f}x)")
+    print(f"dynamic rebuild:      {rebuilt * 1e6:.3f} µs/call  ({legacy / rebuilt:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
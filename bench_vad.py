@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the /ws/phone/audio voice activity detector in cloud_server.py
+Feeds recorded 16-bit WAVs through VoiceActivityDetector in phone-sized
+chunks and reports VAD frames per second on one core. Without WAV arguments
+it synthesises a voiced/silent sample so the script runs anywhere.
+"""
+
+import argparse
+import time
+import wave
+
+import numpy as np
+
+from cloud_server import VAD_FRAME_MS, VoiceActivityDetector
+
+
+def load_wav(path: str):
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise SystemExit(f"{path}: only 16-bit PCM WAVs are supported")
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+        if wav.getnchannels() > 1:
+            samples = samples[::wav.getnchannels()]
+        return samples.tobytes(), wav.getframerate()
+
+
+def synthetic_sample(seconds: int, rate: int = 16000):
+    """Alternating ~1.5 s voiced bursts and pauses over background noise"""
+    rng = np.random.default_rng(7)
+    t = np.arange(seconds * rate) / rate
+    voiced = (t % 3.0) < 1.5
+    pitch = 120 + 40 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voice = 0.2 * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)) * (np.sin(phase) + 0.5 * np.sin(2 * phase))
+    signal = rng.normal(0, 0.004, t.size) + voiced * voice
+    return (np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes(), rate
+
+
+def run(pcm: bytes, rate: int, chunk_ms: int):
+    vad = VoiceActivityDetector(rate)
+    step = rate * 2 * chunk_ms // 1000
+    events = 0
+    started = time.process_time()
+    for offset in range(0, len(pcm), step):
+        events += len(vad.feed(pcm[offset:offset + step]))
+    elapsed = time.process_time() - started
+    return vad.frames_seen, elapsed, events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server-side VAD throughput")
+    parser.add_argument("wavs", nargs="*", help="16-bit PCM WAV files (mono or first channel)")
+    parser.add_argument("--chunk-ms", type=int, default=100, help="Audio per WebSocket frame")
+    parser.add_argument("--seconds", type=int, default=600, help="Length of the synthetic sample")
+    args = parser.parse_args()
+
+    samples = [(path, *load_wav(path)) for path in args.wavs]
+    if not samples:
+        samples = [(f"synthetic {args.seconds}s", *synthetic_sample(args.seconds))]
+
+    print("🎙️ Voice activity detection benchmark")
+    print("=" * 40)
+    print(f"{VAD_FRAME_MS} ms frames, {args.chunk_ms} ms chunks, single core")
+    for name, pcm, rate in samples:
+        frames, elapsed, events = run(pcm, rate, args.chunk_ms)
+        audio_seconds = len(pcm) / 2 / rate
+        print(f"{name}: {frames} frames in {elapsed * 1000:.1f} ms CPU -> "
+              f"{frames / elapsed:,.0f} frames/s, {audio_seconds / elapsed:,.0f}x realtime, {events} events")
+
+
+if __name__ == "__main__":
+    main()
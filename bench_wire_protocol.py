@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the WebSocket wire protocols in cloud_server.py
+Compares JSON text frames with MessagePack binary frames: bytes on the wire
+and server CPU to encode an outbound frame and decode an inbound one.
+"""
+
+import argparse
+import timeit
+
+from cloud_server import THINKING_FRAME, OutboundFrame, decode_json, msgpack, orjson
+
+from bench_message_analyzer import make_code_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON vs MessagePack wire cost")
+    parser.add_argument("--number", type=int, default=5000)
+    args = parser.parse_args()
+
+    if msgpack is None:
+        raise SystemExit("msgpack is not installed (pip install msgpack)")
+
+    samples = {
+        "status": THINKING_FRAME.render("2026-10-17T12:00:00.000000").payload,
+        "grok answer": {
+            "type": "message", "sender": "grok", "message_type": "text",
+            "content": "Wrap the fetch in a retry loop with exponential backoff, and log each failure. " * 40,
+            "timestamp": "2026-10-17T12:00:00.000000"
+        },
+        "cursor 200 lines": {
+            "type": "message", "sender": "cursor", "message_type": "text",
+            "content": make_code_message(200), "timestamp": "2026-10-17T12:00:00.000000"
+        },
+    }
+
+    print("📡 Wire protocol benchmark")
+    print("=" * 40)
+    print(f"JSON encoder: {'orjson' if orjson else 'stdlib json'}")
+    for name, payload in samples.items():
+        text = OutboundFrame(payload).text
+        packed = OutboundFrame(payload).packed
+        number = max(args.number * 200 // len(text), 50)
+        json_encode = timeit.timeit(lambda: OutboundFrame(payload).text, number=number) / number
+        msgpack_encode = timeit.timeit(lambda: OutboundFrame(payload).packed, number=number) / number
+        json_decode = timeit.timeit(lambda: decode_json(text), number=number) / number
+        msgpack_decode = timeit.timeit(lambda: msgpack.unpackb(packed), number=number) / number
+        print(f"{name:>16}: json {len(text.encode()):>6} B, enc {json_encode * 1e6:7.1f} µs, "
+              f"dec {json_decode * 1e6:7.1f} µs | msgpack {len(packed):>6} B, "
+              f"enc {msgpack_encode * 1e6:7.1f} µs, dec {msgpack_decode * 1e6:7.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
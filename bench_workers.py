@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark for multi-worker scaling of cloud_server.py
+Starts mock_grok_server.py, then cloud_server.py at each worker count sharing
+a backplane, and drives it with bench_load.py shards (separate processes, so
+the load generator isn't the bottleneck). Phones and Cursor clients of one
+session usually land on different workers, so Cursor round-trips cross the
+backplane. Reports completed turns per second for each worker count.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout:g}s")
+
+
+def run_load(args, port: int, workers: int, tmp: str) -> dict:
+    """Run the load shards against one server and combine their reports"""
+    shards = []
+    for shard in range(args.load_procs):
+        output = os.path.join(tmp, f"load-{workers}-{shard}.json")
+        command = [
+            sys.executable, os.path.join(HERE, "bench_load.py"),
+            "--url", f"ws://127.0.0.1:{port}",
+            "--phones", str(args.phones // args.load_procs),
+            "--cursors", str(args.phones // args.load_procs),
+            "--duration", str(args.duration),
+            "--mix", args.mix, "--think-time", str(args.think_time), "--speech-rate", "0",
+            "--cursor-reply-time", "0.05",
+            "--session-prefix", f"w{workers}-s{shard}", "--seed", str(shard + 1),
+            "--output", output,
+        ]
+        shards.append((subprocess.Popen(command, stdout=subprocess.DEVNULL), output))
+    reports = []
+    for process, output in shards:
+        process.wait()
+        with open(output) as f:
+            reports.append(json.load(f))
+
+    errors = {}
+    for report in reports:
+        for kind, count in report["errors"].items():
+            errors[kind] = errors.get(kind, 0) + count
+    latencies = [r["latency_ms"]["end_to_end"] for r in reports if r["latency_ms"]["end_to_end"]["count"]]
+    return {
+        "workers": workers,
+        "turns_per_s": round(sum(r["throughput_turns_per_s"] for r in reports), 2),
+        "frames_per_s": round(sum(r["frames_per_s"] for r in reports), 1),
+        "cursor_queries_answered": sum(r["cursor_queries_answered"] for r in reports),
+        # Percentiles can't be merged exactly; report the worst shard's
+        "p50_ms": max((l["p50"] for l in latencies), default=None),
+        "p95_ms": max((l["p95"] for l in latencies), default=None),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cloud_server.py throughput by worker count")
+    parser.add_argument("--workers", default="1,2,4", help="Worker counts to try")
+    parser.add_argument("--backplane", default="sqlite",
+                        help="sqlite, or a redis:// / unix:// URL (e.g. a running backplane_hub.py)")
+    parser.add_argument("--phones", type=int, default=200, help="Phone clients (and as many Cursors)")
+    parser.add_argument("--load-procs", type=int, default=min(os.cpu_count() or 1, 4),
+                        help="Load generator processes")
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--think-time", type=float, default=0.05, help="Mean pause between turns (s)")
+    parser.add_argument("--mix", default="chat=5,programming=4,cursor_query=1")
+    parser.add_argument("--upstream-latency", default="fixed:5", help="mock_grok_server.py --latency")
+    parser.add_argument("--output", help="Also write the JSON results here")
+    args = parser.parse_args()
+
+    print("🧵 Worker scaling benchmark")
+    print("=" * 40)
+    print(f"{os.cpu_count()} CPUs, {args.phones} phones + {args.phones} cursors, {args.load_procs} load processes, "
+          f"{args.duration:g}s per run, backplane {args.backplane}")
+
+    mock_port = free_port()
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "mock_grok_server.py"), "--port", str(mock_port),
+         "--latency", args.upstream_latency, "--token-delay", "fixed:0"],
+        stdout=subprocess.DEVNULL)
+    results = []
+    try:
+        wait_for(f"http://127.0.0.1:{mock_port}/stats")
+        with tempfile.TemporaryDirectory() as tmp:
+            for workers in [int(w) for w in args.workers.split(",")]:
+                port = free_port()
+                backplane = (f"sqlite:///{os.path.join(tmp, f'backplane-{workers}.db')}"
+                             if args.backplane == "sqlite" else args.backplane)
+                env = {
+                    **os.environ,
+                    "PORT": str(port),
+                    "THREEWAYCHAT_WORKERS": str(workers),
+                    "BACKPLANE_URL": backplane,
+                    "GROK_API_KEY": "mock",
+                    "GROK_API_URL": f"http://127.0.0.1:{mock_port}/v1/chat/completions",
+                    "GROK_CACHE_ENABLED": "false",
+                    "CONVERSATION_DB_PATH": os.path.join(tmp, f"conversations-{workers}.db"),
+                    "TRACE_SAMPLE_RATE": "0",
+                    "SESSION_RATE_LIMIT": "0",  # Measure capacity, not the per-session limit
+                }
+                server = subprocess.Popen([sys.executable, os.path.join(HERE, "cloud_server.py")], env=env,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                try:
+                    wait_for(f"http://127.0.0.1:{port}/health")
+                    time.sleep(1)  # Let every worker finish starting up
+                    result = run_load(args, port, workers, tmp)
+                finally:
+                    server.terminate()
+                    server.wait()
+                results.append(result)
+                speedup = result["turns_per_s"] / results[0]["turns_per_s"] if results[0]["turns_per_s"] else 0
+                print(f"{workers} worker(s): {result['turns_per_s']:8.1f} turns/s ({speedup:.2f}x), "
+                      f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+                      f"{result['cursor_queries_answered']} cursor round-trips, errors {result['errors']}")
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
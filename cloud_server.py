@@ -5,36 +5,99 @@ Deploy this to your website or cloud service (Heroku, Railway, Render, etc.)
 """
 
 import asyncio
+import bisect
+import hashlib
+import heapq
+import importlib
 import json
 import logging
 import os
-from typing import List, Optional
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import queue
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from websockets import frames
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
 from datetime import datetime
 import aiohttp
 
+try:
+    import orjson  # Optional: much faster JSON encoding for outbound frames
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack  # Optional: binary wire protocol for clients that negotiate it
+except ImportError:
+    msgpack = None
+
+try:
+    import numpy as np  # Optional: server-side voice activity detection on /ws/phone/audio
+except ImportError:
+    np = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Grok AI Configuration
 GROK_API_KEY = os.getenv("GROK_API_KEY", "")  # Set via Render environment
-GROK_API_URL = "https://api.x.ai/v1/chat/completions"
+GROK_API_URL = os.getenv("GROK_API_URL", "https://api.x.ai/v1/chat/completions")  # Point at mock_grok_server.py offline
+
+# Upstream HTTP pool configuration (one keep-alive pool shared for the app lifetime)
+GROK_CONNECT_TIMEOUT = float(os.getenv("GROK_CONNECT_TIMEOUT", 5))
+GROK_READ_TIMEOUT = float(os.getenv("GROK_READ_TIMEOUT", 60))
+GROK_POOL_LIMIT = int(os.getenv("GROK_POOL_LIMIT", 100))
+GROK_POOL_LIMIT_PER_HOST = int(os.getenv("GROK_POOL_LIMIT_PER_HOST", 32))
+GROK_KEEPALIVE_TIMEOUT = float(os.getenv("GROK_KEEPALIVE_TIMEOUT", 75))
+GROK_DNS_CACHE_TTL = int(os.getenv("GROK_DNS_CACHE_TTL", 300))
+
+# Admission control in front of the x.ai rate limit (per worker)
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", 16))  # Grok calls in flight per worker; 0 = unlimited
+UPSTREAM_QUEUE_SIZE = int(os.getenv("UPSTREAM_QUEUE_SIZE", 64))  # Calls waiting for a slot before new ones are shed
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", 10))  # Seconds a call may wait for a slot
+
+# Streaming: phones opt in per message ("stream": true) or by default via env
+GROK_STREAM_DEFAULT = os.getenv("GROK_STREAM_DEFAULT", "false").lower() == "true"
+STREAM_MIN_CHUNK_CHARS = int(os.getenv("STREAM_MIN_CHUNK_CHARS", 20))
 
 # Available Grok models with pricing info (updated with Grok 4)
+# context_tokens is the model's window; prompt_budget caps how much of it we fill
+# per request, smaller for the fast models so their replies stay quick
 GROK_MODELS = {
-    "grok-2-mini": {"name": "Grok 2 Mini", "cost": "Cheapest", "speed": "Fastest"},
-    "grok-2": {"name": "Grok 2", "cost": "Medium", "speed": "Fast"},  
-    "grok-2-1212": {"name": "Grok 2 (Dec 2024)", "cost": "Medium", "speed": "Fast"},
-    "grok-beta": {"name": "Grok Beta", "cost": "Higher", "speed": "Medium"},
-    "grok-vision-beta": {"name": "Grok Vision", "cost": "Highest", "speed": "Slower"},
-    "grok-4": {"name": "Grok 4", "cost": "Premium", "speed": "Advanced"},
-    "grok-4-heavy": {"name": "Grok 4 Heavy (Multi-Agent)", "cost": "Enterprise", "speed": "Advanced+"}
+    "grok-2-mini": {"name": "Grok 2 Mini", "cost": "Cheapest", "speed": "Fastest",
+                    "context_tokens": 32768, "prompt_budget": 4000},
+    "grok-2": {"name": "Grok 2", "cost": "Medium", "speed": "Fast",
+               "context_tokens": 32768, "prompt_budget": 6000},
+    "grok-2-1212": {"name": "Grok 2 (Dec 2024)", "cost": "Medium", "speed": "Fast",
+                    "context_tokens": 32768, "prompt_budget": 6000},
+    "grok-beta": {"name": "Grok Beta", "cost": "Higher", "speed": "Medium",
+                  "context_tokens": 131072, "prompt_budget": 8000},
+    "grok-vision-beta": {"name": "Grok Vision", "cost": "Highest", "speed": "Slower",
+                         "context_tokens": 8192, "prompt_budget": 4000},
+    "grok-4": {"name": "Grok 4", "cost": "Premium", "speed": "Advanced",
+               "context_tokens": 256000, "prompt_budget": 12000},
+    "grok-4-heavy": {"name": "Grok 4 Heavy (Multi-Agent)", "cost": "Enterprise", "speed": "Advanced+",
+                     "context_tokens": 256000, "prompt_budget": 16000}
 }
 
+GROK_MAX_TOKENS = 1000  # Completion tokens requested per call
+HISTORY_SCAN_LIMIT = int(os.getenv("HISTORY_SCAN_LIMIT", 50))  # Newest entries considered for packing
+
 # Current model (can be changed via API)  
 CURRENT_GROK_MODEL = "grok-4"  # Upgraded to Grok 4 for better performance
 
@@ -53,18 +116,1187 @@ class Message(BaseModel):
     timestamp: Optional[str] = None
 
 
-class ConnectionManager:
-    def __init__(self):
+# Knowledge base retention (per session)
+KB_MAX_ENTRIES = int(os.getenv("KB_MAX_ENTRIES", 500))
+KB_MAX_AGE = float(os.getenv("KB_MAX_AGE", 24 * 3600))  # Seconds; 0 disables age-based expiry
+
+
+class KnowledgeEntry:
+    """Compact stored form of a Message (slots, interned labels, float timestamp)"""
+
+    __slots__ = ("seq", "sender", "content", "message_type", "created")
+
+    def __init__(self, seq: int, sender: str, content: str, message_type: str, created: float):
+        self.seq = seq
+        self.sender = sys.intern(sender)
+        self.content = content
+        self.message_type = sys.intern(message_type)
+        self.created = created
+
+    @property
+    def timestamp(self) -> str:
+        return datetime.fromtimestamp(self.created).isoformat()
+
+    def size(self) -> int:
+        """Approximate bytes held by this entry (shared interned labels not counted)"""
+        return sys.getsizeof(self) + sys.getsizeof(self.content) + sys.getsizeof(self.created)
+
+    def to_dict(self) -> dict:
+        return {
+            "seq": self.seq,
+            "sender": self.sender,
+            "content": self.content,
+            "message_type": self.message_type,
+            "timestamp": self.timestamp
+        }
+
+
+class KnowledgeBase:
+    """Ring buffer of recent messages bounded by entry count and age"""
+
+    def __init__(self, max_entries: int = KB_MAX_ENTRIES, max_age: float = KB_MAX_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries: Deque[KnowledgeEntry] = deque()
+        self.next_seq = 0
+        self.bytes = 0
+        self.evicted = 0
+
+    def append(self, message: Message, seq: Optional[int] = None) -> KnowledgeEntry:
+        """Add a message at the next seq, or at ``seq`` if another worker is already past ours"""
+        created = time.time()
+        if message.timestamp:
+            try:
+                created = datetime.fromisoformat(message.timestamp).timestamp()
+            except ValueError:
+                pass
+        seq = self.next_seq if seq is None else max(seq, self.next_seq)
+        entry = KnowledgeEntry(seq, message.sender, message.content, message.message_type, created)
+        self.next_seq = seq + 1
+        self.entries.append(entry)
+        self.bytes += entry.size()
+        while len(self.entries) > self.max_entries:
+            self._evict_oldest()
+        self.expire()
+        return entry
+
+    def restore(self, seq: int, sender: str, content: str, message_type: str, created: float) -> KnowledgeEntry:
+        """Re-insert an entry replayed from the durable log, keeping its seq"""
+        entry = KnowledgeEntry(seq, sender, content, message_type, created)
+        self.next_seq = max(self.next_seq, seq + 1)
+        self.entries.append(entry)
+        self.bytes += entry.size()
+        while len(self.entries) > self.max_entries:
+            self._evict_oldest()
+        return entry
+
+    def expire(self):
+        """Drop entries older than max_age"""
+        if not self.max_age:
+            return
+        cutoff = time.time() - self.max_age
+        while self.entries and self.entries[0].created < cutoff:
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        entry = self.entries.popleft()
+        self.bytes -= entry.size()
+        self.evicted += 1
+
+    def recent(self, count: int) -> List[KnowledgeEntry]:
+        """Last ``count`` entries, oldest first"""
+        if count <= 0:
+            return []
+        start = max(len(self.entries) - count, 0)
+        return [self.entries[i] for i in range(start, len(self.entries))]
+
+    def page(self, before: Optional[int] = None, after: Optional[int] = None, limit: int = 100,
+             sender: Optional[str] = None, message_type: Optional[str] = None) -> List[KnowledgeEntry]:
+        """Up to ``limit`` matching entries, oldest first.
+
+        With ``after`` the page starts just past that seq; otherwise it is the
+        newest page below ``before`` (or the newest page overall).
+        """
+        def matches(entry: KnowledgeEntry) -> bool:
+            return ((before is None or entry.seq < before)
+                    and (after is None or entry.seq > after)
+                    and (sender is None or entry.sender == sender)
+                    and (message_type is None or entry.message_type == message_type))
+
+        page = []
+        if after is not None:
+            for entry in self.entries:
+                if matches(entry):
+                    page.append(entry)
+                    if len(page) >= limit:
+                        break
+            return page
+        for entry in reversed(self.entries):
+            if matches(entry):
+                page.append(entry)
+                if len(page) >= limit:
+                    break
+        page.reverse()
+        return page
+
+    @property
+    def oldest_seq(self) -> Optional[int]:
+        return self.entries[0].seq if self.entries else None
+
+    def __iter__(self) -> Iterator[KnowledgeEntry]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "max_age": self.max_age,
+            "bytes": self.bytes + sys.getsizeof(self.entries),
+            "evicted": self.evicted
+        }
+
+
+# Durable conversation log ("" disables persistence)
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "conversations.db")
+STORE_BATCH_SIZE = int(os.getenv("STORE_BATCH_SIZE", 256))  # Max rows per group commit
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", 0.05))  # Seconds to gather a batch
+STORE_REPLAY_LIMIT = int(os.getenv("STORE_REPLAY_LIMIT", 50000))  # Max rows replayed on startup
+
+
+class ConversationStore:
+    """Append-only SQLite (WAL) log of every knowledge base entry.
+
+    ``append`` only puts the row on a queue; a writer thread commits rows in
+    batches so the event loop never waits on disk.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS messages ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " session_id TEXT NOT NULL,"
+        " seq INTEGER NOT NULL,"
+        " sender TEXT NOT NULL,"
+        " content TEXT NOT NULL,"
+        " message_type TEXT NOT NULL,"
+        " created REAL NOT NULL)",
+        "DROP INDEX IF EXISTS idx_messages_session",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_session_seq ON messages (session_id, seq)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages (sender, created)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (created)",
+    )
+    INSERT = ("INSERT INTO messages (session_id, seq, sender, content, message_type, created)"
+              " VALUES (?, ?, ?, ?, ?, ?)")
+
+    def __init__(self, path: str, batch_size: int = STORE_BATCH_SIZE,
+                 flush_interval: float = STORE_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending: queue.Queue = queue.Queue()
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.conflicts = 0
+        self.writer: Optional[threading.Thread] = None
+        with self.connect() as db:
+            for statement in self.SCHEMA:
+                db.execute(statement)
+
+    def connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def start(self):
+        self.writer = threading.Thread(target=self._write_loop, name="conversation-store", daemon=True)
+        self.writer.start()
+
+    def append(self, session_id: str, entry: KnowledgeEntry):
+        self.pending.put_nowait((session_id, entry.seq, entry.sender, entry.content,
+                                 entry.message_type, entry.created))
+
+    def close(self):
+        """Flush everything queued and stop the writer"""
+        if self.writer is not None:
+            self.pending.put(None)
+            self.writer.join()
+            self.writer = None
+
+    def _write_loop(self):
+        db = self.connect()
+        stopping = False
+        while not stopping:
+            row = self.pending.get()
+            if row is None:
+                break
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    row = self.pending.get(timeout=timeout) if timeout > 0 else self.pending.get_nowait()
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            try:
+                try:
+                    with db:
+                        db.executemany(self.INSERT, batch)
+                    self.written += len(batch)
+                except sqlite3.IntegrityError:
+                    self._write_each(db, batch)
+                self.batches += 1
+            except sqlite3.Error as e:
+                self.errors += 1
+                logger.error(f"Conversation store write failed ({len(batch)} rows lost): {e}")
+        db.close()
+
+    def _write_each(self, db: sqlite3.Connection, batch: List[tuple]):
+        """Insert a batch row by row so one duplicate (session_id, seq) doesn't lose the rest"""
+        for row in batch:
+            try:
+                with db:
+                    db.execute(self.INSERT, row)
+                self.written += 1
+            except sqlite3.IntegrityError:
+                self.conflicts += 1
+                logger.error(f"Conversation store already has seq {row[1]} for session {row[0]}; row dropped")
+
+    def next_seq(self, session_id: str) -> int:
+        """Seq after the newest logged row for a session, so a recreated session doesn't reuse ids"""
+        with self.connect() as db:
+            row = db.execute("SELECT MAX(seq) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def load_recent(self, max_age: float = KB_MAX_AGE, limit: int = STORE_REPLAY_LIMIT) -> List[tuple]:
+        """Newest rows, in seq order per session, for replaying into memory after a restart"""
+        cutoff = time.time() - max_age if max_age else 0
+        with self.connect() as db:
+            rows = db.execute(
+                "SELECT session_id, seq, sender, content, message_type, created FROM messages"
+                " WHERE created >= ? ORDER BY id DESC LIMIT ?",
+                (cutoff, limit)
+            ).fetchall()
+        # Workers log rows as they flush, so insertion order isn't always seq order
+        rows.sort(key=lambda row: (row[0], row[1]))
+        return rows
+
+    def fetch(self, session_id: str, before: Optional[int] = None, after: Optional[int] = None,
+              limit: int = 100, sender: Optional[str] = None,
+              message_type: Optional[str] = None) -> List[dict]:
+        """Same paging rules as KnowledgeBase.page, served from the log"""
+        clauses = ["session_id = ?"]
+        params: list = [session_id]
+        if before is not None:
+            clauses.append("seq < ?")
+            params.append(before)
+        if after is not None:
+            clauses.append("seq > ?")
+            params.append(after)
+        if sender is not None:
+            clauses.append("sender = ?")
+            params.append(sender)
+        if message_type is not None:
+            clauses.append("message_type = ?")
+            params.append(message_type)
+        order = "ASC" if after is not None else "DESC"
+        with self.connect() as db:
+            rows = db.execute(
+                "SELECT seq, sender, content, message_type, created FROM messages"
+                f" WHERE {' AND '.join(clauses)} ORDER BY seq {order} LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        if order == "DESC":
+            rows.reverse()
+        return [
+            {
+                "seq": seq,
+                "sender": sender,
+                "content": content,
+                "message_type": message_type,
+                "timestamp": datetime.fromtimestamp(created).isoformat()
+            }
+            for seq, sender, content, message_type, created in rows
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "written": self.written,
+            "batches": self.batches,
+            "queued": self.pending.qsize(),
+            "errors": self.errors,
+            "conflicts": self.conflicts
+        }
+
+
+# Static half of Grok's system prompt. Built once and kept byte-for-byte stable
+# so it always forms the same prompt prefix (lets upstream prompt caching hit).
+GROK_STATIC_CONTEXT = " ".join([
+        "You are Grok in a three-way conversation with a user (phone) and Cursor AI (coding assistant).",
+        "\n=== COMPLETE PROJECT ECOSYSTEM ===",
+        
+        "🎯 **ThreeWayChat App** (Current App):",
+        "- Voice-controlled iOS app with Swift/SwiftUI",
+        "- Real-time WebSocket communication via FastAPI server on Render",
+        "- Speech-to-text (SFSpeechRecognizer) and text-to-speech (AVSpeechSynthesizer)",
+        "- Voice Activity Detection (VAD) with automatic restart after responses",
+        "- Anti-feedback loop protection (headset mode)",
+        "- Smart context system for efficient conversation history",
+        "- Project switching capabilities between multiple programs",
+        "- Files: ContentView.swift, cloud_server.py, real_cursor_integration.js",
+        "- Server: voice-chat-app-cc40.onrender.com (FastAPI + WebSockets)",
+        
+        "🏢 **Big Beautiful Program** (Main Application):",
+        "- Primary business application with its own API server",
+        "- Has dedicated API endpoints and authentication system",
+        "- Integrated via voice commands through ThreeWayChat",
+        "- Can execute functions remotely via API calls",
+        "- Currently configurable in cursor integration",
+        
+        "📱 **Companion App** (Business Tool):",
+        "- Business management application on localhost:5001",
+        "- API Key: X authentication (xai-wQ6qJGFoJT8GSwJ7Uht3vYzVzDWNw1i7EewqHkVNRpJcgNkcGDZYQa8w9OjhMPJMaZZEg9Cqm4IqF3mJQ)",
+        "- Endpoints: /api/health, /api/contacts, /api/analytics",
+        "- Sales tracking: /api/rolling-sales, /api/rolling-sales/export",
+        "- Location services: /api/geocode, /api/att-fiber-check",
+        "- Data management: /api/sync, POST /api/contacts",
+        "- Full voice control via 'Switch to Companion App' command",
+        
+        "🔧 **Technical Architecture**:",
+        "- Cursor AI Integration: real_cursor_integration.js (Node.js WebSocket client)",
+        "- AI Models: Grok-4 (1000 tokens), Cursor AI (programming help)",
+        "- Voice Flow: Phone → Server → Grok/Cursor → Phone",
+        "- Project Management: Voice switching between all three programs",
+        "- API Integration: RESTful calls with formatted responses",
+        "- Smart Context: Conversation-aware, token-efficient system"
+])
+
+
+# Keyword lists the message analyzer matches (as substrings of the lowercased text)
+ANALYZER_KEYWORDS = {
+    "debugging": ["debug", "error", "undefined", "bug", "fix"],
+    "coding": ["code", "function", "javascript", "python", "programming"],
+    "explanation": ["how", "what", "why", "explain"],
+    "question": ["?", "help", "can you"],
+    "problem": ["error", "bug", "issue", "problem", "broken"],
+    "solved": ["fixed", "solved", "working", "resolved", "success"],
+    "programming": [
+        "code", "program", "function", "class", "bug", "error", "debug",
+        "python", "javascript", "swift", "java", "c++", "sql", "api",
+        "algorithm", "data structure", "framework", "library", "git",
+        "deploy", "server", "database", "frontend", "backend", "fullstack"
+    ],
+    "companion_app": ["companion app"],
+    "companion_api": ["api", "health", "contacts", "analytics", "sales"],
+    "big_beautiful": ["big beautiful"],
+    "threeway_chat": ["threeway", "three way", "three-way"],
+}
+
+
+ANALYZER_TOKEN_CACHE_SIZE = 50000  # Distinct tokens remembered before the memo is reset
+
+
+def _compile_analyzer():
+    """One regex for every single-word keyword, plus the categories each match implies.
+
+    The pattern is a lookahead tried at every position with the longest
+    alternatives first, so the keyword it reports at a position is the longest
+    one starting there. That keyword's categories include those of every
+    keyword contained in it ("debug" also counts as "bug"), which together
+    gives the same answers as testing each keyword with ``in``. Keywords with
+    a space in them can span tokens, so they are kept aside as phrases.
+    """
+    categories: Dict[str, set] = {}
+    for category, words in ANALYZER_KEYWORDS.items():
+        for word in words:
+            categories.setdefault(word, set()).add(category)
+    implied = {
+        word: frozenset().union(*(categories[other] for other in categories if other in word))
+        for word in categories
+    }
+    phrases = [(word, cats) for word, cats in implied.items() if " " in word]
+    words = sorted((word for word in implied if " " not in word), key=len, reverse=True)
+    pattern = re.compile("(?=(" + "|".join(re.escape(word) for word in words) + "))")
+    return pattern, implied, phrases
+
+
+ANALYZER_PATTERN, ANALYZER_IMPLIED, ANALYZER_PHRASES = _compile_analyzer()
+_token_categories: Dict[str, frozenset] = {}
+
+
+def token_categories(token: str) -> frozenset:
+    """Categories of every keyword inside one whitespace-free token, memoised.
+
+    A keyword without spaces can only occur inside a single token, so matching
+    distinct tokens is equivalent to matching the whole message.
+    """
+    categories = _token_categories.get(token)
+    if categories is None:
+        categories = frozenset().union(*(ANALYZER_IMPLIED[m.group(1)] for m in ANALYZER_PATTERN.finditer(token)))
+        if len(_token_categories) >= ANALYZER_TOKEN_CACHE_SIZE:
+            _token_categories.clear()
+        _token_categories[token] = categories
+    return categories
+
+
+# Topic tracking for the prompt's key points
+TOPIC_HALF_LIFE = float(os.getenv("TOPIC_HALF_LIFE", 20))  # Messages until a term's weight halves
+TOPIC_MAX_TERMS = int(os.getenv("TOPIC_MAX_TERMS", 500))  # Vocabulary kept per session
+TOPIC_TOP_K = 10  # Ranked terms kept ready for prompt building
+TOPIC_PROMPT_COUNT = 5  # Topics shown in the prompt's key points
+TOPIC_TERMS_PER_MESSAGE = 200  # Terms counted per message, so code dumps can't swamp the topics
+TOPIC_WORD_PATTERN = re.compile(r"[a-z][a-z0-9_+#-]{3,}")
+TOPIC_STOPWORDS = frozenset("""
+    about above after again against also because been before being below between both could does doing
+    down during each either else even ever every from further have having here hers herself himself
+    however into itself just like made make many more most much must myself only other ought ours
+    ourselves over same should some such than that their theirs them themselves then there these they
+    this those through under until upon very want well were what when where which while whom whose
+    will with within without would your yours yourself yourselves
+    okay yeah yes thanks thank please sure really think know going gonna need right still thing things
+    something anything actually maybe just tell said says look looks
+    const await async return true false null none self import export default void static public private
+    print console function's let's it's that's there's what's don't doesn't didn't can't won't isn't
+""".split())
+
+
+class TopicTracker:
+    """Exponentially decayed term frequencies with a ready-ranked top-k.
+
+    Instead of decaying every score on each message, each new occurrence is
+    worth ``weight``, which grows by 2**(1/half_life) per message; older
+    counts shrink relative to it, so an update is O(1). Scores are rescaled
+    when the weight gets large, and the vocabulary is trimmed back to
+    ``max_terms`` once it doubles. Because all scores decay together, only the
+    term just updated can change rank, so the top-k list is kept sorted with
+    O(k) work per update and served in O(k).
+    """
+
+    def __init__(self, half_life: float = TOPIC_HALF_LIFE, max_terms: int = TOPIC_MAX_TERMS,
+                 top_k: int = TOPIC_TOP_K):
+        self.growth = 2 ** (1 / half_life)
+        self.max_terms = max_terms
+        self.top_k = top_k
+        self.weight = 1.0
+        self.scores: Dict[str, float] = {}
+        self.ranked: List[str] = []
+
+    def observe(self, terms: Iterable[str]) -> bool:
+        """Count one message's terms; returns True if the top-k changed"""
+        before = list(self.ranked)
+        self.weight *= self.growth
+        if self.weight > 1e12:
+            self._rescale()
+        for term in terms:
+            score = self.scores.get(term, 0.0) + self.weight
+            self.scores[term] = score
+            self._rank(term, score)
+        if len(self.scores) > 2 * self.max_terms:
+            self._trim()
+        return self.ranked != before
+
+    def top(self, count: int) -> List[str]:
+        return self.ranked[:count]
+
+    def _rank(self, term: str, score: float):
+        ranked = self.ranked
+        if term in ranked:
+            ranked.remove(term)
+        elif len(ranked) >= self.top_k and score <= self.scores[ranked[-1]]:
+            return
+        index = len(ranked)
+        while index > 0 and self.scores[ranked[index - 1]] < score:
+            index -= 1
+        ranked.insert(index, term)
+        del ranked[self.top_k:]
+
+    def _rescale(self):
+        for term in self.scores:
+            self.scores[term] /= self.weight
+        self.weight = 1.0
+
+    def _trim(self):
+        keep = sorted(self.scores, key=self.scores.__getitem__, reverse=True)[:self.max_terms]
+        self.scores = {term: self.scores[term] for term in keep}
+
+
+class MessageAnalysis:
+    """What one scan of a message found; read by the context, memory and routing code"""
+
+    __slots__ = ("intent", "is_question", "is_debugging", "is_solved", "is_programming",
+                 "projects", "companion_api", "terms")
+
+    def __init__(self, categories: set, terms: List[str]):
+        if "debugging" in categories:
+            self.intent = "debugging"
+        elif "coding" in categories:
+            self.intent = "coding"
+        elif "explanation" in categories:
+            self.intent = "explanation"
+        else:
+            self.intent = None
+        self.is_question = "question" in categories
+        self.is_debugging = "problem" in categories
+        self.is_solved = "solved" in categories
+        self.is_programming = "programming" in categories
+        self.projects = [project for project in ("threeway_chat", "big_beautiful", "companion_app")
+                         if project in categories]
+        self.companion_api = "companion_api" in categories
+        self.terms = terms
+
+
+def analyze_message(content: str, max_terms: int = TOPIC_TERMS_PER_MESSAGE) -> MessageAnalysis:
+    """Scan a message once for every keyword category and its first topic terms.
+
+    The message is lowercased and split once; each distinct token is matched
+    against the compiled keyword pattern (memoised, since code and chat reuse
+    the same tokens), and the few multi-word phrases are checked on the text.
+    """
+    content_lower = content.lower()
+    categories = set()
+    for token in set(content_lower.split()):
+        found = _token_categories.get(token)
+        if found is None:
+            found = token_categories(token)
+        if found:
+            categories |= found
+    for phrase, found in ANALYZER_PHRASES:
+        if phrase in content_lower:
+            categories |= found
+
+    terms = []
+    if max_terms > 0:
+        for match in TOPIC_WORD_PATTERN.finditer(content_lower):
+            term = match.group()
+            if term not in TOPIC_STOPWORDS:
+                terms.append(term)
+                if len(terms) >= max_terms:
+                    break
+    return MessageAnalysis(categories, terms)
+
+
+def encode_json(payload: dict) -> str:
+    """Encode a frame as compact JSON, with orjson when it's installed"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode()
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_json(data):
+    """Parse an inbound JSON frame, with orjson when it's installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class OutboundFrame:
+    """An outbound message encoded at most once, however many clients receive it"""
+
+    __slots__ = ("payload", "_text", "_packed", "droppable")
+
+    def __init__(self, payload: dict, text: Optional[str] = None, droppable: bool = False):
+        self.payload = payload
+        self._text = text
+        self._packed: Optional[bytes] = None
+        # Status frames a slow consumer can lose without missing anything (see ConnectionWriter)
+        self.droppable = droppable
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = encode_json(self.payload)
+        return self._text
+
+    @property
+    def packed(self) -> bytes:
+        """The frame as MessagePack, for connections on MSGPACK_SUBPROTOCOL"""
+        if self._packed is None:
+            self._packed = msgpack.packb(self.payload)
+        return self._packed
+
+    @classmethod
+    def of(cls, message) -> "OutboundFrame":
+        return message if isinstance(message, OutboundFrame) else cls(message)
+
+
+# Wire protocols, negotiated through Sec-WebSocket-Protocol. Clients that don't
+# ask for one get JSON text frames; MessagePack uses the same message schema.
+JSON_SUBPROTOCOL = "threewaychat.json"
+MSGPACK_SUBPROTOCOL = "threewaychat.msgpack"
+
+
+def negotiate_subprotocol(websocket: WebSocket) -> Optional[str]:
+    """Pick the first wire protocol the client offered that this server speaks"""
+    for offered in websocket.scope.get("subprotocols", []):
+        if offered == MSGPACK_SUBPROTOCOL and msgpack is not None:
+            return offered
+        if offered == JSON_SUBPROTOCOL:
+            return offered
+    return None
+
+
+async def receive_raw(websocket: WebSocket, subprotocol: Optional[str]):
+    """Read one client frame: bytes on MSGPACK_SUBPROTOCOL, text otherwise"""
+    if subprotocol == MSGPACK_SUBPROTOCOL:
+        return await websocket.receive_bytes()
+    return await websocket.receive_text()
+
+
+def decode_message(raw, subprotocol: Optional[str]) -> dict:
+    """Parse a frame from receive_raw into a message dict"""
+    if subprotocol == MSGPACK_SUBPROTOCOL:
+        message_data = msgpack.unpackb(raw)
+    else:
+        message_data = decode_json(raw)
+    if not isinstance(message_data, dict):
+        raise ValueError(f"Expected a message object, got {type(message_data).__name__}")
+    return message_data
+
+
+class StaticFrame:
+    """A frame whose only varying field is its timestamp, pre-encoded around it"""
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+        self.prefix = encode_json(payload)[:-1] + ',"timestamp":"'
+
+    def render(self, timestamp: str) -> OutboundFrame:
+        return OutboundFrame({**self.payload, "timestamp": timestamp}, self.prefix + timestamp + '"}', droppable=True)
+
+
+# Status frames sent on every turn
+THINKING_FRAME = StaticFrame({"type": "system", "content": "Grok is thinking..."})
+CONSULTING_CURSOR_FRAME = StaticFrame({"type": "system", "content": "Grok is consulting Cursor AI..."})
+PROCESSING_FRAME = StaticFrame({"type": "system", "content": "Processing with Grok AI..."})
+
+
+# Per-stage latency histograms and counters, served by /metrics in Prometheus text format
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Latency histogram keyed by label values; observe() is a bisect and three adds"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets=METRICS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series: Dict[tuple, list] = {}  # labels -> [bucket counts, sum, count]
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            base = format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{base}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base.rstrip(',')}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{base.rstrip(',')}}} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values: Dict[tuple, int] = {}
+
+    def inc(self, *labels: str):
+        self.values[labels] = self.values.get(labels, 0) + 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{{{format_labels(self.label_names, labels).rstrip(',')}}} {value}")
+        return lines
+
+
+def format_labels(names: Tuple[str, ...], values: tuple) -> str:
+    """Label pairs with a trailing comma, ready for a le="..." to follow"""
+    return "".join(f'{name}="{value}",' for name, value in zip(names, values))
+
+
+TURN_CONTEXT_SECONDS = Histogram(
+    "threewaychat_turn_context_seconds", "Phone message received to Grok context built", ("model",))
+UPSTREAM_TTFB_SECONDS = Histogram(
+    "threewaychat_upstream_ttfb_seconds",
+    "Grok request to response headers (complete) or first delta (stream)", ("model", "mode"))
+UPSTREAM_DURATION_SECONDS = Histogram(
+    "threewaychat_upstream_duration_seconds", "Grok request to last byte", ("model", "mode"))
+CURSOR_WAIT_SECONDS = Histogram(
+    "threewaychat_cursor_wait_seconds", "Grok query sent to Cursor until its reply or timeout", ("model",))
+SUMMARY_SECONDS = Histogram(
+    "threewaychat_summary_seconds", "Grok call summarising a Cursor reply", ("model",))
+SEND_SECONDS = Histogram(
+    "threewaychat_send_seconds", "One frame written to a client socket", ("model", "role"))
+MESSAGES_TOTAL = Counter("threewaychat_messages_total", "Messages added to a conversation", ("model", "sender"))
+UPSTREAM_ERRORS_TOTAL = Counter("threewaychat_upstream_errors_total", "Failed Grok calls", ("model", "mode"))
+FALLBACK_RESPONSES_TOTAL = Counter(
+    "threewaychat_fallback_responses_total", "Canned replies sent because no API key is set", ("model",))
+UPSTREAM_QUEUE_WAIT_SECONDS = Histogram(
+    "threewaychat_upstream_queue_wait_seconds", "Time a Grok call waited for an upstream slot", ("model",))
+ADMISSION_REJECTIONS_TOTAL = Counter(
+    "threewaychat_admission_rejections_total", "Messages shed with a busy frame", ("reason",))
+PROMPT_TOKENS = Histogram(
+    "threewaychat_prompt_tokens", "Estimated prompt tokens packed into one Grok request", ("model",),
+    buckets=(250, 500, 1000, 2000, 4000, 6000, 8000, 12000, 16000, 32000))
+METRICS = (TURN_CONTEXT_SECONDS, UPSTREAM_TTFB_SECONDS, UPSTREAM_DURATION_SECONDS, CURSOR_WAIT_SECONDS,
+           SUMMARY_SECONDS, SEND_SECONDS, MESSAGES_TOTAL, UPSTREAM_ERRORS_TOTAL, FALLBACK_RESPONSES_TOTAL,
+           UPSTREAM_QUEUE_WAIT_SECONDS, ADMISSION_REJECTIONS_TOTAL, PROMPT_TOKENS)
+
+
+# Per-turn tracing: sampled turns keep their spans in a ring buffer for /debug/traces
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))  # Fraction of turns traced
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 500))  # Most recent traces kept
+TRACE_SLOWEST_SIZE = int(os.getenv("TRACE_SLOWEST_SIZE", 50))  # Slowest traces kept since startup
+
+
+class Span:
+    """Times a with-block into its trace; also works around awaits"""
+
+    __slots__ = ("trace", "name", "attrs", "started")
+
+    def __init__(self, trace: "Trace", name: str, attrs: dict):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.add_span(self.name, self.started, time.perf_counter(), self.attrs)
+        return False
+
+
+class _NoSpan:
+    """What an unsampled trace hands out: a with-block that records nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class Trace:
+    """Spans of one phone or cursor turn, relative to when its message arrived.
+
+    Every turn gets one so ``started`` can feed the latency metrics; only
+    sampled traces record spans and reach the tracer's buffers.
+    """
+
+    __slots__ = ("trace_id", "kind", "session_id", "model", "sampled", "started", "started_at",
+                 "spans", "duration", "outcome")
+
+    def __init__(self, kind: str, session_id: str, started: Optional[float] = None):
+        self.sampled = TRACE_SAMPLE_RATE >= 1 or random.random() < TRACE_SAMPLE_RATE
+        self.trace_id = uuid.uuid4().hex[:12] if self.sampled else None
+        self.kind = kind
+        self.session_id = session_id
+        self.model = CURRENT_GROK_MODEL
+        self.started = time.perf_counter() if started is None else started
+        self.started_at = time.time()
+        self.spans: List[tuple] = []
+        self.duration: Optional[float] = None
+        self.outcome: Optional[str] = None
+
+    def span(self, name: str, **attrs):
+        return Span(self, name, attrs) if self.sampled else NO_SPAN
+
+    def add_span(self, name: str, started: float, ended: float, attrs: Optional[dict] = None):
+        if self.sampled:
+            self.spans.append((name, started - self.started, ended - started, attrs))
+
+    def finish(self, outcome: str = "ok"):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.started
+        self.outcome = outcome
+        if self.sampled:
+            tracer.record(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "kind": self.kind,
+            "session": self.session_id,
+            "model": self.model,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "outcome": self.outcome,
+            "spans": [
+                {"name": name, "start_ms": round(offset * 1000, 3), "duration_ms": round(length * 1000, 3),
+                 **(attrs or {})}
+                for name, offset, length, attrs in self.spans
+            ]
+        }
+
+
+class Tracer:
+    """Finished traces: a ring of the most recent plus a min-heap of the slowest"""
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE, slowest_size: int = TRACE_SLOWEST_SIZE):
+        self.recent: Deque[Trace] = deque(maxlen=size)
+        self.slowest: List[tuple] = []  # (duration, seq, trace), smallest first
+        self.slowest_size = slowest_size
+        self.recorded = 0
+
+    def record(self, trace: Trace):
+        self.recorded += 1
+        self.recent.append(trace)
+        item = (trace.duration, self.recorded, trace)
+        if len(self.slowest) < self.slowest_size:
+            heapq.heappush(self.slowest, item)
+        elif trace.duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def snapshot(self, limit: int, session_id: Optional[str] = None) -> dict:
+        def wanted(trace: Trace) -> bool:
+            return session_id is None or trace.session_id == session_id
+
+        recent = [t for t in reversed(self.recent) if wanted(t)][:limit]
+        slowest = [t for _, _, t in sorted(self.slowest, reverse=True) if wanted(t)][:limit]
+        return {
+            "sample_rate": TRACE_SAMPLE_RATE,
+            "recorded": self.recorded,
+            "slowest": [t.to_dict() for t in slowest],
+            "recent": [t.to_dict() for t in recent]
+        }
+
+
+tracer = Tracer()
+
+
+# Session registry configuration
+DEFAULT_SESSION_ID = "default"  # Legacy clients that don't send a session id share this one
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+PHONE_QUEUE_SIZE = int(os.getenv("PHONE_QUEUE_SIZE", 8))  # Utterances buffered per session
+CURSOR_QUEUE_SIZE = int(os.getenv("CURSOR_QUEUE_SIZE", 8))  # Cursor questions for Grok buffered per session
+BARGE_IN_ENABLED = os.getenv("BARGE_IN_ENABLED", "true").lower() == "true"  # New utterance cancels the one in flight
+CURSOR_QUERY_TIMEOUT = float(os.getenv("CURSOR_QUERY_TIMEOUT", 30))  # Seconds to wait for Cursor to answer Grok
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", 3600))  # Seconds before an idle session is dropped
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", 10000))
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", 256))  # Frames buffered per connection
+SLOW_CONSUMER_POLICY = os.getenv("SLOW_CONSUMER_POLICY", "drop_status")  # drop_status or disconnect
+SLOW_CONSUMER_CLOSE_CODE = 4008
+SESSION_RATE_LIMIT = float(os.getenv("SESSION_RATE_LIMIT", 0.5))  # Grok-bound messages per second; 0 disables
+SESSION_BURST = int(os.getenv("SESSION_BURST", 5))  # Messages a session may send back to back
+
+
+# Outbound counters, summed across connections
+outbound_stats = {"dropped": 0, "slow_consumer_disconnects": 0, "send_errors": 0}
+
+
+class ConnectionWriter:
+    """Owns one WebSocket's outbound side: a bounded queue drained by its own task.
+
+    Senders only enqueue, so a phone on a bad link never holds up Cursor or the
+    turn producing the frames. When the queue is full SLOW_CONSUMER_POLICY
+    applies: "drop_status" sheds queued status frames (anything queued after
+    them supersedes them) and disconnects only if real messages still don't
+    fit; "disconnect" closes the connection straight away.
+    """
+
+    def __init__(self, websocket: WebSocket, label: str, on_close=None, binary: bool = False,
+                 role: str = "client"):
+        self.websocket = websocket
+        self.label = label
+        self.role = role  # phone, cursor or audio, for metrics
+        self.binary = binary  # MessagePack binary frames instead of JSON text
+        self.on_close = on_close  # Coroutine function run once the writer gives up
+        self.queue: Deque[OutboundFrame] = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.close_reason: Optional[str] = None
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.send_seconds = 0.0
+        self.max_send_seconds = 0.0
+        self.task = asyncio.create_task(self._run())
+
+    def send(self, frame: OutboundFrame) -> bool:
+        """Queue a frame; returns False if it was dropped or the writer is closed"""
+        if self.closed:
+            return False
+        if len(self.queue) >= OUTBOUND_QUEUE_SIZE:
+            if SLOW_CONSUMER_POLICY == "drop_status":
+                self._drop_status_frames()
+                if frame.droppable and len(self.queue) >= OUTBOUND_QUEUE_SIZE:
+                    self._count_dropped(1)
+                    return False
+            if len(self.queue) >= OUTBOUND_QUEUE_SIZE:
+                outbound_stats["slow_consumer_disconnects"] += 1
+                self._fail(f"slow consumer ({len(self.queue)} frames queued)", SLOW_CONSUMER_CLOSE_CODE)
+                return False
+        self.queue.append(frame)
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self.ready.set()
+        return True
+
+    def _drop_status_frames(self):
+        kept = [frame for frame in self.queue if not frame.droppable]
+        if len(kept) < len(self.queue):
+            self._count_dropped(len(self.queue) - len(kept))
+            self.queue = deque(kept)
+
+    def _count_dropped(self, count: int):
+        self.dropped += count
+        outbound_stats["dropped"] += count
+
+    async def _run(self):
+        while True:
+            if not self.queue:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            frame = self.queue.popleft()
+            started = time.perf_counter()
+            try:
+                if self.binary:
+                    await self.websocket.send_bytes(frame.packed)
+                else:
+                    await self.websocket.send_text(frame.text)
+            except Exception as e:
+                logger.error(f"Error sending to {self.label}: {e}")
+                outbound_stats["send_errors"] += 1
+                self._fail(f"send failed: {e}")
+                return
+            elapsed = time.perf_counter() - started
+            SEND_SECONDS.observe(elapsed, CURRENT_GROK_MODEL, self.role)
+            self.sent += 1
+            self.send_seconds += elapsed
+            self.max_send_seconds = max(self.max_send_seconds, elapsed)
+
+    def _fail(self, reason: str, code: Optional[int] = None):
+        if self.closed:
+            return
+        logger.warning(f"📤 Closing {self.label} writer: {reason}")
+        self.closed = True
+        self.close_reason = reason
+        asyncio.create_task(self._shutdown(code))
+
+    async def _shutdown(self, code: Optional[int]):
+        await self.close(code)
+        if self.on_close is not None:
+            await self.on_close()
+
+    async def close(self, code: Optional[int] = None):
+        """Stop the writer, discarding queued frames, and optionally close the socket"""
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.queue.clear()
+        self.closed = True
+        if code is not None:
+            try:
+                await self.websocket.close(code=code)
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "wire": "msgpack" if self.binary else "json",
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "send_ms_avg": round(self.send_seconds / self.sent * 1000, 3) if self.sent else 0.0,
+            "send_ms_max": round(self.max_send_seconds * 1000, 3),
+            "closed": self.close_reason
+        }
+
+
+class TokenBucket:
+    """Allows ``burst`` actions at once, refilled at ``rate`` per second"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float = SESSION_RATE_LIMIT, burst: int = SESSION_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        """Spend a token if one is available"""
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def retry_after(self) -> float:
+        """Seconds until the next token"""
+        return max(1 - self.tokens, 0) / self.rate if self.rate > 0 else 0.0
+
+
+# Grok -> Cursor query counters, summed across sessions
+cursor_query_stats = {"sent": 0, "resolved": 0, "timed_out": 0, "cancelled": 0, "unavailable": 0}
+
+
+def get_session_id(websocket: WebSocket) -> str:
+    """Resolve the session id a client asked for at connect time.
+
+    Clients pass it as ``?session=<id>`` or an ``X-Session-Id`` header; anything
+    missing or malformed falls back to the shared default session.
+    """
+    session_id = websocket.query_params.get("session") or websocket.headers.get("x-session-id")
+    if session_id and SESSION_ID_PATTERN.match(session_id):
+        return session_id
+    return DEFAULT_SESSION_ID
+
+
+class TurnWorker:
+    """One role's queue of turns and the task that runs them one at a time.
+
+    The WebSocket receive loop only parses and enqueues, so it keeps reading
+    pings, cancels and Cursor replies while a turn waits on Grok. The worker
+    finishes each turn's trace, which started when the loop got the message.
+    """
+
+    QUEUE_SIZES = {"phone": PHONE_QUEUE_SIZE, "cursor": CURSOR_QUEUE_SIZE}
+
+    def __init__(self, session: "Session", role: str, process_turn):
+        self.session = session
+        self.role = role
+        self.process_turn = process_turn
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_SIZES[role])
+        self.current: Optional[asyncio.Task] = None
+        self.task = asyncio.create_task(self._run())
+
+    @property
+    def running(self) -> bool:
+        return not self.task.done()
+
+    async def _run(self):
+        session_id = self.session.session_id
+        while True:
+            message_data, trace, queued_at = await self.queue.get()
+            trace.add_span("queue", queued_at, time.perf_counter())
+            turn = asyncio.create_task(self.process_turn(self.session, message_data, trace))
+            self.current = turn
+            try:
+                # wait() doesn't raise if the turn is cancelled, only if this worker is
+                await asyncio.wait({turn})
+            except asyncio.CancelledError:
+                turn.cancel()
+                trace.finish("cancelled")
+                raise
+            finally:
+                self.current = None
+
+            if turn.cancelled():
+                logger.info(f"✋ {self.role.capitalize()} turn cancelled (session: {session_id})")
+                trace.finish("cancelled")
+            elif turn.exception() is not None:
+                logger.error(f"{self.role.capitalize()} turn failed (session: {session_id}): {turn.exception()}")
+                trace.finish("error")
+            else:
+                trace.finish()
+
+    def enqueue(self, message_data: dict, trace: Trace):
+        if self.queue.full():
+            dropped, dropped_trace, _ = self.queue.get_nowait()
+            dropped_trace.finish("dropped")
+            logger.warning(f"{self.role.capitalize()} queue full, dropping oldest turn: "
+                           f"{str(dropped.get('content', ''))[:50]}")
+        self.queue.put_nowait((message_data, trace, time.perf_counter()))
+
+    def clear(self, outcome: str) -> int:
+        """Drop turns the worker hasn't started, finishing their traces with ``outcome``"""
+        drained = 0
+        while not self.queue.empty():
+            _, trace, _ = self.queue.get_nowait()
+            trace.finish(outcome)
+            drained += 1
+        return drained
+
+    def cancel_current(self) -> bool:
+        if self.current is not None and not self.current.done():
+            self.current.cancel()
+            return True
+        return False
+
+    async def stop(self):
+        if self.task.done():
+            return
+        self.task.cancel()
+        if self.task is not asyncio.current_task():
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+class Session:
+    """One phone/cursor pair with its own knowledge base and context"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
         self.phone_connection: Optional[WebSocket] = None
         self.cursor_connection: Optional[WebSocket] = None
-        self.knowledge_base: List[Message] = []
+        # Each connection's outbound frames go through its own writer task
+        self.phone_writer: Optional[ConnectionWriter] = None
+        self.cursor_writer: Optional[ConnectionWriter] = None
+        # Roles connected to other workers, mapped to the worker holding them (see Backplane)
+        self.remote_roles: Dict[str, str] = {}
+        self.last_activity = time.monotonic()
+        # Grok -> Cursor queries awaiting a reply, keyed by correlation id (insertion ordered)
+        self.pending_cursor_queries: Dict[str, asyncio.Future] = {}
+        # Turns that call Grok are queued per role and run by one worker task each
+        self.turn_workers: Dict[str, TurnWorker] = {}
+        # Messages that would call Grok spend a token; phone and Cursor share the bucket
+        self.rate_limit = TokenBucket()
+        self.knowledge_base = KnowledgeBase()
         self.conversation_context = {
             "topic": None,
             "cursor_last_response": None,
             "user_question": None,
-            "key_points": [],
+            "key_points": [],  # Top topics from self.topics, refreshed as they change
             "conversation_type": "general"  # general, debugging, coding, explanation
         }
+        self.topics = TopicTracker()
+        # Bumped whenever something the prompt's dynamic suffix reads changes
+        self.context_version = 0
+        self._context_cache: Optional[str] = None
+        self._context_cache_version = -1
         
         # Extended memory for comprehensive project knowledge
         self.extended_memory = {
@@ -93,56 +1325,241 @@ class ConnectionManager:
             }
         }
 
-    async def connect_phone(self, websocket: WebSocket):
-        await websocket.accept()
+    @property
+    def is_idle(self) -> bool:
+        return self.phone_connection is None and self.cursor_connection is None and not self.remote_roles
+
+    @property
+    def has_cursor(self) -> bool:
+        return self.cursor_connection is not None or "cursor" in self.remote_roles
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    async def connect_phone(self, websocket: WebSocket, subprotocol: Optional[str] = None):
+        await websocket.accept(subprotocol=subprotocol)
+        previous = self.phone_writer
         self.phone_connection = websocket
-        logger.info("📱 Phone connected")
+        self.phone_writer = ConnectionWriter(
+            websocket, f"phone ({self.session_id})", lambda: self.disconnect_phone(websocket),
+            binary=subprotocol == MSGPACK_SUBPROTOCOL, role="phone")
+        self.touch()
+        self.publish("presence", role="phone", connected=True)
+        logger.info(f"📱 Phone connected (session: {self.session_id})")
+
+        # A second phone on the same session replaces the first one
+        if previous is not None:
+            logger.info(f"📱 Replacing previous phone connection (session: {self.session_id})")
+            await previous.close(code=4000)
 
         # Send connection confirmation
         await self.send_to_phone({
             "type": "system",
             "content": "Connected to ThreeWayChat cloud server",
+            "session": self.session_id,
             "timestamp": self.get_timestamp()
         })
 
-    async def connect_cursor(self, websocket: WebSocket):
-        await websocket.accept()
+    async def connect_cursor(self, websocket: WebSocket, subprotocol: Optional[str] = None):
+        await websocket.accept(subprotocol=subprotocol)
+        previous = self.cursor_writer
         self.cursor_connection = websocket
-        logger.info("💻 Cursor connected")
+        self.cursor_writer = ConnectionWriter(
+            websocket, f"cursor ({self.session_id})", lambda: self.disconnect_cursor(websocket),
+            binary=subprotocol == MSGPACK_SUBPROTOCOL, role="cursor")
+        self.touch()
+        self.publish("presence", role="cursor", connected=True)
+        logger.info(f"💻 Cursor connected (session: {self.session_id})")
+
+        # A second cursor on the same session replaces the first one
+        if previous is not None:
+            logger.info(f"💻 Replacing previous cursor connection (session: {self.session_id})")
+            await previous.close(code=4000)
 
         # Send connection confirmation
         await self.send_to_cursor({
             "type": "system",
             "content": "Connected to ThreeWayChat cloud server",
+            "session": self.session_id,
             "timestamp": self.get_timestamp()
         })
 
-    async def disconnect_phone(self):
+    async def disconnect_phone(self, websocket: Optional[WebSocket] = None):
+        # Ignore late disconnects from a connection that was already replaced
+        if websocket is not None and websocket is not self.phone_connection:
+            return
         self.phone_connection = None
-        logger.info("📱 Phone disconnected")
-
-    async def disconnect_cursor(self):
+        writer, self.phone_writer = self.phone_writer, None
+        if writer is not None:
+            await writer.close()
+        self.touch()
+        self.publish("presence", role="phone", connected=False)
+        await self.stop_turn_worker("phone")
+        logger.info(f"📱 Phone disconnected (session: {self.session_id})")
+
+    async def disconnect_cursor(self, websocket: Optional[WebSocket] = None):
+        # Ignore late disconnects from a connection that was already replaced
+        if websocket is not None and websocket is not self.cursor_connection:
+            return
         self.cursor_connection = None
-        logger.info("💻 Cursor disconnected")
-
-    async def send_to_phone(self, message: dict):
-        if self.phone_connection:
-            try:
-                await self.phone_connection.send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"Error sending to phone: {e}")
-                await self.disconnect_phone()
+        writer, self.cursor_writer = self.cursor_writer, None
+        if writer is not None:
+            await writer.close()
+        self.touch()
+        self.publish("presence", role="cursor", connected=False)
+        self.cancel_cursor_queries()
+        await self.stop_turn_worker("cursor")
+        logger.info(f"💻 Cursor disconnected (session: {self.session_id})")
+
+    async def send_to_phone(self, message) -> bool:
+        """Queue a dict or pre-encoded OutboundFrame for the phone's writer,
+        or hand it to the worker the phone is connected to"""
+        if self.phone_writer is None:
+            return self.forward("phone", message)
+        return self.phone_writer.send(OutboundFrame.of(message))
+
+    async def send_to_cursor(self, message) -> bool:
+        """Queue a dict or pre-encoded OutboundFrame for Cursor's writer,
+        or hand it to the worker Cursor is connected to"""
+        if self.cursor_writer is None:
+            return self.forward("cursor", message)
+        return self.cursor_writer.send(OutboundFrame.of(message))
+
+    def forward(self, role: str, message) -> bool:
+        if role not in self.remote_roles:
+            return False
+        self.publish("frame", role=role, payload=OutboundFrame.of(message).payload)
+        return True
+
+    def publish(self, kind: str, **fields):
+        """Tell the other workers about a change to this session (no-op with one worker)"""
+        if backplane.shared:
+            backplane.publish({"kind": kind, "session": self.session_id, **fields})
+
+    def deliver(self, role: str, payload: dict) -> bool:
+        """Send a frame another worker forwarded, if the role is connected here"""
+        writer = self.phone_writer if role == "phone" else self.cursor_writer
+        if writer is None:
+            return False
+        return writer.send(OutboundFrame(payload))
+
+    def set_remote_role(self, role: str, worker: str, connected: bool):
+        """Track a phone or Cursor connecting to (or leaving) another worker"""
+        self.touch()
+        if not connected:
+            # A late disconnect from a worker whose connection was already replaced changes nothing
+            if self.remote_roles.get(role) == worker:
+                del self.remote_roles[role]
+            return
+        self.remote_roles[role] = worker
+        # The newer connection wins, as it does within a worker
+        writer = self.phone_writer if role == "phone" else self.cursor_writer
+        if writer is not None:
+            logger.info(f"🔀 {role} reconnected on another worker, closing it here (session: {self.session_id})")
+            asyncio.create_task(writer.close(code=4000))
+
+    def busy_frame(self, reason: str, retry_after: float) -> dict:
+        """Tell a client its message was shed instead of answered"""
+        return {
+            "type": "busy",
+            "sender": "system",
+            "reason": reason,
+            "retry_after": round(retry_after, 2),
+            "content": "Grok is busy right now, please try again in a moment.",
+            "timestamp": self.get_timestamp()
+        }
 
-    async def send_to_cursor(self, message: dict):
-        if self.cursor_connection:
-            try:
-                await self.cursor_connection.send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"Error sending to cursor: {e}")
-                await self.disconnect_cursor()
+    def connection_stats(self) -> dict:
+        return {
+            "phone": self.phone_writer.stats() if self.phone_writer else None,
+            "cursor": self.cursor_writer.stats() if self.cursor_writer else None
+        }
 
-    async def broadcast(self, message: dict, exclude_sender: str = None):
-        """Broadcast message to all connected clients"""
+    def start_turn_worker(self, role: str, process_turn):
+        """Start the role's turn worker unless one is already running"""
+        worker = self.turn_workers.get(role)
+        if worker is None or not worker.running:
+            self.turn_workers[role] = TurnWorker(self, role, process_turn)
+
+    def enqueue_turn(self, role: str, message_data: dict, trace: Optional[Trace] = None):
+        """Queue a turn for the role's worker; a phone utterance barges in on the
+        turn in flight and on any still waiting behind it"""
+        worker = self.turn_workers[role]
+        if role == "phone" and BARGE_IN_ENABLED:
+            superseded = worker.clear("superseded")
+            if worker.cancel_current() or superseded:
+                logger.info(f"✋ Barge-in: new utterance interrupts current turn and {superseded} queued "
+                            f"(session: {self.session_id})")
+        worker.enqueue(message_data, trace or Trace(role, self.session_id))
+
+    def cancel_turn(self, role: str) -> bool:
+        """Cancel the role's turn in flight, if any; its upstream call is abandoned"""
+        worker = self.turn_workers.get(role)
+        return worker is not None and worker.cancel_current()
+
+    async def stop_turn_worker(self, role: str):
+        worker = self.turn_workers.pop(role, None)
+        if worker is not None:
+            await worker.stop()
+
+    def register_cursor_query(self) -> Tuple[str, asyncio.Future]:
+        """Create a correlation id and the future its Cursor reply will resolve"""
+        query_id = uuid.uuid4().hex[:12]
+        future = asyncio.get_running_loop().create_future()
+        self.pending_cursor_queries[query_id] = future
+        cursor_query_stats["sent"] += 1
+        return query_id, future
+
+    def resolve_cursor_query(self, query_id: Optional[str], content: str) -> bool:
+        """Hand a Cursor reply to the query waiting for it.
+
+        Replies without a ``reply_to`` id go to the oldest pending query; the
+        cursor endpoint only passes those on for clients that have never sent
+        one (older Cursor clients). Returns False when nothing was waiting.
+        """
+        if query_id is None:
+            query_id = next(iter(self.pending_cursor_queries), None)
+        future = self.pending_cursor_queries.pop(query_id, None) if query_id else None
+        if future is None or future.done():
+            return False
+        future.set_result(content)
+        cursor_query_stats["resolved"] += 1
+        return True
+
+    def cancel_cursor_queries(self):
+        """Release every pending query with no answer, e.g. when Cursor goes away"""
+        for future in self.pending_cursor_queries.values():
+            if not future.done():
+                future.set_result(None)
+                cursor_query_stats["cancelled"] += 1
+        self.pending_cursor_queries.clear()
+
+    async def ask_cursor(self, query: str, timeout: float = CURSOR_QUERY_TIMEOUT) -> Optional[str]:
+        """Send a Grok query to Cursor and wait for its correlated reply"""
+        if not self.has_cursor:
+            cursor_query_stats["unavailable"] += 1
+            return None
+
+        query_id, future = self.register_cursor_query()
+        try:
+            await self.send_to_cursor({
+                "type": "query",
+                "sender": "grok",
+                "query_id": query_id,
+                "content": query,
+                "timestamp": self.get_timestamp()
+            })
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            cursor_query_stats["timed_out"] += 1
+            logger.warning(f"⏰ Cursor query {query_id} timed out after {timeout}s (session: {self.session_id})")
+            return None
+        finally:
+            self.pending_cursor_queries.pop(query_id, None)
+
+    async def broadcast(self, message, exclude_sender: str = None):
+        """Broadcast message to both clients in this session"""
+        message = OutboundFrame.of(message)
         if exclude_sender != "phone" and self.phone_connection:
             await self.send_to_phone(message)
         if exclude_sender != "cursor" and self.cursor_connection:
@@ -152,86 +1569,108 @@ class ConnectionManager:
         return datetime.now().isoformat()
 
     def add_to_knowledge_base(self, message: Message):
-        """Store message in knowledge base and update context"""
-        self.knowledge_base.append(message)
-        self.update_conversation_context(message)
-        self.update_extended_memory(message)  # Enhanced memory tracking
+        """Store message in knowledge base and update context; returns its analysis.
+
+        With several workers the entry is only appended (and logged) when the
+        backplane echoes it back, so every worker numbers it the same way; the
+        context is updated here straight away for the call about to use it.
+        """
+        MESSAGES_TOTAL.inc(CURRENT_GROK_MODEL, message.sender)
+        if backplane.shared:
+            backplane.publish({
+                "kind": "kb", "session": self.session_id, "seq": self.knowledge_base.next_seq,
+                "sender": message.sender, "content": message.content,
+                "message_type": message.message_type, "timestamp": message.timestamp
+            }, echo=True)
+        else:
+            self.log_entry(self.knowledge_base.append(message))
+        analysis = analyze_message(message.content)
+        self.update_conversation_context(message, analysis)
+        self.update_extended_memory(message, analysis)  # Enhanced memory tracking
         logger.info(
             f"Added to knowledge base: {message.sender}: {message.content[:50]}...")
+        return analysis
     
-    def update_conversation_context(self, message: Message):
+    def restore_entry(self, seq: int, sender: str, content: str, message_type: str, created: float):
+        """Replay a logged message into memory without logging it again"""
+        entry = self.knowledge_base.restore(seq, sender, content, message_type, created)
+        message = Message(sender=sender, content=content, message_type=message_type, timestamp=entry.timestamp)
+        analysis = analyze_message(content)
+        self.update_conversation_context(message, analysis)
+        self.update_extended_memory(message, analysis)
+
+    def log_entry(self, entry: KnowledgeEntry):
+        if conversation_store is not None:
+            conversation_store.append(self.session_id, entry)
+
+    def apply_shared_message(self, message: Message, seq: int, local: bool):
+        """Append a message in backplane order, at or after the seq its worker saw.
+
+        Every worker applies the same events in the same order, so they agree
+        on each entry's seq; only the worker that produced it logs it, and only
+        the others still need to update their context.
+        """
+        self.touch()
+        entry = self.knowledge_base.append(message, seq)
+        if local:
+            self.log_entry(entry)
+            return
+        analysis = analyze_message(message.content)
+        self.update_conversation_context(message, analysis)
+        self.update_extended_memory(message, analysis)
+
+    def has_logged(self, sender: str, content: str, timestamp: str) -> bool:
+        """Whether a message is already in memory, e.g. replayed from the log at startup"""
+        created = datetime.fromisoformat(timestamp).timestamp()
+        return any(entry.created == created and entry.sender == sender and entry.content == content
+                   for entry in self.knowledge_base.recent(HISTORY_SCAN_LIMIT))
+
+    def update_conversation_context(self, message: Message, analysis: MessageAnalysis):
         """Smart context management to reduce token usage"""
-        content_lower = message.content.lower()
-        
         # Update conversation type
-        if any(word in content_lower for word in ['debug', 'error', 'undefined', 'bug', 'fix']):
-            self.conversation_context["conversation_type"] = "debugging"
-        elif any(word in content_lower for word in ['code', 'function', 'javascript', 'python', 'programming']):
-            self.conversation_context["conversation_type"] = "coding"
-        elif any(word in content_lower for word in ['how', 'what', 'why', 'explain']):
-            self.conversation_context["conversation_type"] = "explanation"
+        if analysis.intent and analysis.intent != self.conversation_context["conversation_type"]:
+            self.conversation_context["conversation_type"] = analysis.intent
+            self.context_version += 1
         
         # Track user questions
-        if message.sender == "phone" and any(char in message.content for char in ['?', 'help', 'can you']):
+        if message.sender == "phone" and analysis.is_question:
             self.conversation_context["user_question"] = message.content[:100]
+            self.context_version += 1
         
         # Track cursor responses
         if message.sender == "cursor":
             self.conversation_context["cursor_last_response"] = message.content[:200]
+            self.context_version += 1
         
-        # Extract key points (simple keyword extraction)
-        keywords = []
-        for word in message.content.split():
-            if len(word) > 4 and word.lower() not in ['this', 'that', 'with', 'have', 'will', 'from', 'they']:
-                keywords.append(word.lower())
-        
-        # Keep only recent key points to limit memory
-        self.conversation_context["key_points"].extend(keywords[:3])
-        self.conversation_context["key_points"] = self.conversation_context["key_points"][-10:]  # Last 10 keywords
+        # Track weighted topics; key points only change when the top terms do
+        if analysis.terms and self.topics.observe(analysis.terms):
+            self.conversation_context["key_points"] = self.topics.top(TOPIC_PROMPT_COUNT)
+            self.context_version += 1
     
     def get_smart_context_for_grok(self) -> str:
-        """Generate comprehensive context for Grok with full project knowledge"""
+        """Generate comprehensive context for Grok with full project knowledge.
+
+        The static prefix is precomputed; the dynamic suffix is only rebuilt
+        when ``context_version`` has moved since the last call.
+        """
+        if self._context_cache_version != self.context_version:
+            self._context_cache = " ".join([GROK_STATIC_CONTEXT, *self._build_dynamic_context()])
+            self._context_cache_version = self.context_version
+        return self._context_cache
+
+    def cache_context_digest(self) -> str:
+        """Digest of the state that changes what a good answer is, for the response cache"""
         ctx = self.conversation_context
-        
-        context_parts = [
-            "You are Grok in a three-way conversation with a user (phone) and Cursor AI (coding assistant).",
-            "\n=== COMPLETE PROJECT ECOSYSTEM ===",
-            
-            "🎯 **ThreeWayChat App** (Current App):",
-            "- Voice-controlled iOS app with Swift/SwiftUI",
-            "- Real-time WebSocket communication via FastAPI server on Render",
-            "- Speech-to-text (SFSpeechRecognizer) and text-to-speech (AVSpeechSynthesizer)",
-            "- Voice Activity Detection (VAD) with automatic restart after responses",
-            "- Anti-feedback loop protection (headset mode)",
-            "- Smart context system for efficient conversation history",
-            "- Project switching capabilities between multiple programs",
-            "- Files: ContentView.swift, cloud_server.py, real_cursor_integration.js",
-            "- Server: voice-chat-app-cc40.onrender.com (FastAPI + WebSockets)",
-            
-            "🏢 **Big Beautiful Program** (Main Application):",
-            "- Primary business application with its own API server",
-            "- Has dedicated API endpoints and authentication system",
-            "- Integrated via voice commands through ThreeWayChat",
-            "- Can execute functions remotely via API calls",
-            "- Currently configurable in cursor integration",
-            
-            "📱 **Companion App** (Business Tool):",
-            "- Business management application on localhost:5001",
-            "- API Key: X authentication (xai-wQ6qJGFoJT8GSwJ7Uht3vYzVzDWNw1i7EewqHkVNRpJcgNkcGDZYQa8w9OjhMPJMaZZEg9Cqm4IqF3mJQ)",
-            "- Endpoints: /api/health, /api/contacts, /api/analytics",
-            "- Sales tracking: /api/rolling-sales, /api/rolling-sales/export",
-            "- Location services: /api/geocode, /api/att-fiber-check",
-            "- Data management: /api/sync, POST /api/contacts",
-            "- Full voice control via 'Switch to Companion App' command",
-            
-            "🔧 **Technical Architecture**:",
-            "- Cursor AI Integration: real_cursor_integration.js (Node.js WebSocket client)",
-            "- AI Models: Grok-4 (1000 tokens), Cursor AI (programming help)",
-            "- Voice Flow: Phone → Server → Grok/Cursor → Phone",
-            "- Project Management: Voice switching between all three programs",
-            "- API Integration: RESTful calls with formatted responses",
-            "- Smart Context: Conversation-aware, token-efficient system"
-        ]
+        raw = "\x1f".join((
+            ctx["conversation_type"] or "",
+            ctx["cursor_last_response"] or "",
+            self.extended_memory["technical_context"]["active_debugging"] or ""
+        ))
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _build_dynamic_context(self) -> List[str]:
+        ctx = self.conversation_context
+        context_parts = []
         
         # Add conversation type context
         if ctx["conversation_type"] == "debugging":
@@ -252,8 +1691,7 @@ class ConnectionManager:
         
         # Add key topics
         if ctx["key_points"]:
-            recent_topics = list(set(ctx["key_points"][-5:]))  # Last 5 unique keywords
-            context_parts.append(f"\n🔑 **Key Points**: {', '.join(recent_topics)}")
+            context_parts.append(f"\n🔑 **Key Points**: {', '.join(ctx['key_points'])}")
         
         context_parts.append("\n\n🎯 **Your Role**: Provide contextual help understanding the full ecosystem. Reference specific projects, APIs, and technical details when relevant.")
         
@@ -269,14 +1707,12 @@ class ConnectionManager:
             solved = self.extended_memory["technical_context"]["solved_problems"][-2:]  # Last 2 solutions
             context_parts.append(f"\n✅ **Recently Solved**: {'; '.join(solved)}")
         
-        return " ".join(context_parts)
+        return context_parts
     
-    def update_extended_memory(self, message: Message):
+    def update_extended_memory(self, message: Message, analysis: MessageAnalysis):
         """Update extended memory with conversation insights"""
-        content_lower = message.content.lower()
-        
         # Track errors and problems
-        if any(word in content_lower for word in ['error', 'bug', 'issue', 'problem', 'broken']):
+        if analysis.is_debugging:
             error_summary = message.content[:100] + "..." if len(message.content) > 100 else message.content
             self.extended_memory["technical_context"]["recent_errors"].append(error_summary)
             self.extended_memory["technical_context"]["recent_errors"] = self.extended_memory["technical_context"]["recent_errors"][-5:]  # Keep last 5
@@ -284,20 +1720,20 @@ class ConnectionManager:
             # Set active debugging if not already set
             if not self.extended_memory["technical_context"]["active_debugging"]:
                 self.extended_memory["technical_context"]["active_debugging"] = error_summary
+            self.context_version += 1
         
         # Track solutions
-        if any(word in content_lower for word in ['fixed', 'solved', 'working', 'resolved', 'success']):
+        if analysis.is_solved:
             if self.extended_memory["technical_context"]["active_debugging"]:
                 solution = f"Resolved: {self.extended_memory['technical_context']['active_debugging']}"
                 self.extended_memory["technical_context"]["solved_problems"].append(solution)
                 self.extended_memory["technical_context"]["solved_problems"] = self.extended_memory["technical_context"]["solved_problems"][-5:]  # Keep last 5
                 self.extended_memory["technical_context"]["active_debugging"] = None
+                self.context_version += 1
         
         # Track project interactions
-        if 'companion app' in content_lower:
-            if 'api' in content_lower or any(endpoint in content_lower for endpoint in ['health', 'contacts', 'analytics', 'sales']):
-                import datetime
-                self.extended_memory["project_states"]["companion_app"]["last_interaction"] = datetime.datetime.now().isoformat()
+        if "companion_app" in analysis.projects and analysis.companion_api:
+            self.extended_memory["project_states"]["companion_app"]["last_interaction"] = datetime.now().isoformat()
         
         # Store in long-term conversation history (keep last 50 messages)
         self.extended_memory["conversation_history"].append({
@@ -309,8 +1745,787 @@ class ConnectionManager:
         self.extended_memory["conversation_history"] = self.extended_memory["conversation_history"][-50:]
 
 
+class SessionLimitReached(Exception):
+    """Raised instead of creating a session when MAX_SESSIONS are live and none is idle"""
+
+
+class ConnectionManager:
+    """Registry of sessions keyed by the id each client negotiates at connect time"""
+
+    def __init__(self):
+        self.sessions: Dict[str, Session] = {}
+
+    def get_session(self, session_id: str) -> Session:
+        """Return the session for an id, creating it on first use.
+
+        At MAX_SESSIONS idle sessions are pruned to make room; if none is idle
+        the registry is full and SessionLimitReached is raised.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            if len(self.sessions) >= MAX_SESSIONS and not self.prune_idle_sessions(force=True):
+                logger.warning(f"🚫 Session limit reached ({MAX_SESSIONS}), refusing {session_id}")
+                raise SessionLimitReached(session_id)
+            session = Session(session_id)
+            self.sessions[session_id] = session
+            logger.info(f"🆕 Session created: {session_id} ({len(self.sessions)} active)")
+        return session
+
+    def find_session(self, session_id: str) -> Optional[Session]:
+        return self.sessions.get(session_id)
+
+    def prune_idle_sessions(self, force: bool = False) -> int:
+        """Drop sessions with no connections that have been idle past the TTL.
+
+        With ``force`` the TTL is ignored so a full registry can make room.
+        """
+        now = time.monotonic()
+        stale = [
+            session_id for session_id, session in self.sessions.items()
+            if session.is_idle and (force or now - session.last_activity > SESSION_IDLE_TTL)
+        ]
+        for session_id in stale:
+            del self.sessions[session_id]
+        if stale:
+            logger.info(f"🧹 Pruned {len(stale)} idle sessions")
+        return len(stale)
+
+    async def session_for(self, websocket: WebSocket) -> Session:
+        """The session a new connection asked for; one recreated after pruning
+        continues the logged seq instead of starting again at 0"""
+        self.prune_idle_sessions()
+        session_id = get_session_id(websocket)
+        if session_id not in self.sessions and conversation_store is not None:
+            next_seq = await asyncio.to_thread(conversation_store.next_seq, session_id)
+            kb = self.get_session(session_id).knowledge_base
+            kb.next_seq = max(kb.next_seq, next_seq)
+        return self.get_session(session_id)
+
+    async def refuse(self, websocket: WebSocket, subprotocol: Optional[str] = None):
+        """Accept and close straight away with 1013 (try again later), so the client sees why"""
+        await websocket.accept(subprotocol=subprotocol)
+        await websocket.close(code=1013)
+
+    async def connect_phone(self, websocket: WebSocket, subprotocol: Optional[str] = None) -> Session:
+        session = await self.session_for(websocket)
+        await session.connect_phone(websocket, subprotocol)
+        return session
+
+    async def connect_cursor(self, websocket: WebSocket, subprotocol: Optional[str] = None) -> Session:
+        session = await self.session_for(websocket)
+        await session.connect_cursor(websocket, subprotocol)
+        return session
+
+    async def broadcast(self, message, exclude_sender: str = None):
+        """Broadcast message to every connected client in every session.
+
+        The frame is encoded once and only queued on each connection's writer,
+        so one slow client doesn't delay the rest.
+        """
+        message = OutboundFrame.of(message)
+        for session in list(self.sessions.values()):
+            await session.broadcast(message, exclude_sender)
+
+    def connection_counts(self) -> dict:
+        return {
+            "phone": sum(1 for s in self.sessions.values() if s.phone_connection is not None),
+            "cursor": sum(1 for s in self.sessions.values() if s.cursor_connection is not None)
+        }
+
+    def outbound_stats(self) -> dict:
+        writers = [w for s in self.sessions.values() for w in (s.phone_writer, s.cursor_writer) if w]
+        return {
+            **outbound_stats,
+            "queued": sum(len(w.queue) for w in writers),
+            "max_queue_depth": max((len(w.queue) for w in writers), default=0),
+            "policy": SLOW_CONSUMER_POLICY
+        }
+
+    def get_timestamp(self):
+        return datetime.now().isoformat()
+
+
+# Cross-worker state. With THREEWAYCHAT_WORKERS > 1 each uvicorn worker owns the
+# sockets it accepted; the backplane carries frames, knowledge base appends and
+# presence between them so a phone on one worker can talk to Cursor on another.
+# Not WEB_CONCURRENCY: some hosts (e.g. Heroku) set that themselves
+THREEWAYCHAT_WORKERS = int(os.getenv("THREEWAYCHAT_WORKERS", 1))  # uvicorn worker processes started by __main__
+BACKPLANE_URL = os.getenv("BACKPLANE_URL", "")  # local, sqlite:///path, redis://host:port or unix:///path
+BACKPLANE_DB_PATH = os.getenv("BACKPLANE_DB_PATH", "backplane.db")  # Used when workers > 1 and no URL is set
+BACKPLANE_CHANNEL = os.getenv("BACKPLANE_CHANNEL", "threewaychat:events")
+BACKPLANE_POLL_INTERVAL = float(os.getenv("BACKPLANE_POLL_INTERVAL", 0.005))  # SQLite backplane poll, seconds
+BACKPLANE_RETENTION = float(os.getenv("BACKPLANE_RETENTION", 60))  # Seconds SQLite keeps delivered events
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+# Backplane counters for this worker
+backplane_stats = {"published": 0, "received": 0, "delivered": 0, "undeliverable": 0, "errors": 0}
+
+
+class LocalBackplane:
+    """Single-process backplane: every connection lives here, so nothing is sent.
+
+    Cross-process backplanes override ``_send`` and call ``_receive`` with each
+    event body another worker published.
+    """
+
+    name = "local"
+    shared = False
+
+    def __init__(self):
+        self.handler = None
+
+    async def start(self, handler):
+        self.handler = handler
+
+    def publish(self, event: dict, echo: bool = False):
+        """Send an event to every other worker without waiting for it.
+
+        With ``echo`` the event also comes back to this worker, in the same
+        order every other worker sees it.
+        """
+        event["origin"] = WORKER_ID
+        if echo:
+            event["echo"] = True
+        backplane_stats["published"] += 1
+        self._send(encode_json(event))
+
+    def _send(self, body: str):
+        pass
+
+    def _receive(self, bodies: Iterable[str]):
+        for body in bodies:
+            try:
+                event = decode_json(body)
+                if event.get("origin") != WORKER_ID or event.get("echo"):
+                    backplane_stats["received"] += 1
+                    self.handler(event)
+            except Exception as e:
+                backplane_stats["errors"] += 1
+                logger.error(f"Backplane event failed: {e}")
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"kind": self.name, "worker": WORKER_ID, **backplane_stats}
+
+
+class SQLiteBackplane(LocalBackplane):
+    """Events table in a shared SQLite (WAL) file, for workers on one box.
+
+    One thread per worker inserts what this worker publishes and polls for rows
+    the others inserted, handing them to the event loop in batches.
+    """
+
+    name = "sqlite"
+    shared = True
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS events ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " body TEXT NOT NULL,"
+        " created REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_events_created ON events (created)",
+    )
+
+    def __init__(self, path: str, poll_interval: float = BACKPLANE_POLL_INTERVAL,
+                 retention: float = BACKPLANE_RETENTION):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.pending: queue.Queue = queue.Queue()
+        self.last_id = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _prepare(self):
+        with self.connect() as db:
+            for statement in self.SCHEMA:
+                db.execute(statement)
+            # Only events published from now on are ours to apply
+            self.last_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    async def start(self, handler):
+        await super().start(handler)
+        self.loop = asyncio.get_running_loop()
+        await asyncio.to_thread(self._prepare)
+        self.thread = threading.Thread(target=self._run, name="backplane", daemon=True)
+        self.thread.start()
+
+    def _send(self, body: str):
+        self.pending.put_nowait((body, time.time()))
+
+    def _run(self):
+        db = self.connect()
+        next_prune = time.monotonic() + self.retention
+        stopping = False
+        while not stopping:
+            rows = []
+            try:
+                rows.append(self.pending.get(timeout=self.poll_interval))
+                while True:
+                    rows.append(self.pending.get_nowait())
+            except queue.Empty:
+                pass
+            if None in rows:
+                stopping = True
+                rows.remove(None)
+            try:
+                if rows:
+                    with db:
+                        db.executemany("INSERT INTO events (body, created) VALUES (?, ?)", rows)
+                found = db.execute("SELECT id, body FROM events WHERE id > ? ORDER BY id",
+                                   (self.last_id,)).fetchall()
+                if found:
+                    self.last_id = found[-1][0]
+                    self.loop.call_soon_threadsafe(self._receive, [body for _, body in found])
+                if time.monotonic() >= next_prune:
+                    with db:
+                        db.execute("DELETE FROM events WHERE created < ?", (time.time() - self.retention,))
+                    next_prune = time.monotonic() + self.retention
+            except sqlite3.Error as e:
+                backplane_stats["errors"] += 1
+                logger.error(f"Backplane database error: {e}")
+            except RuntimeError:
+                break  # Event loop already closed
+        db.close()
+
+    async def close(self):
+        if self.thread is not None:
+            self.pending.put(None)
+            await asyncio.to_thread(self.thread.join)
+            self.thread = None
+
+    def stats(self) -> dict:
+        return {**super().stats(), "path": self.path, "queued": self.pending.qsize(), "last_id": self.last_id}
+
+
+class RedisBackplane(LocalBackplane):
+    """Redis pub/sub over RESP, spoken directly so no client library is needed.
+
+    Works with a real Redis (``redis://host:port``) or a local stand-in such as
+    backplane_hub.py, which can also listen on a Unix socket (``unix:///path``).
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str, channel: str = BACKPLANE_CHANNEL):
+        super().__init__()
+        self.url = url
+        self.channel = channel
+        self.outbox: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+        self.reconnects = 0
+
+    async def _open(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        target = urlparse(self.url)
+        if target.scheme == "unix":
+            return await asyncio.open_unix_connection(target.path)
+        return await asyncio.open_connection(target.hostname or "localhost", target.port or 6379)
+
+    @staticmethod
+    def command(*parts: str) -> bytes:
+        encoded = [part.encode() for part in parts]
+        return b"".join([f"*{len(encoded)}\r\n".encode()]
+                        + [f"${len(part)}\r\n".encode() + part + b"\r\n" for part in encoded])
+
+    @classmethod
+    async def read_reply(cls, reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("backplane connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise ConnectionError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            return None if size < 0 else (await reader.readexactly(size + 2))[:-2].decode()
+        if kind == b"*":
+            return [await cls.read_reply(reader) for _ in range(int(rest))]
+        raise ConnectionError(f"unexpected reply {line[:20]!r}")
+
+    async def start(self, handler):
+        await super().start(handler)
+        self.outbox = asyncio.Queue()
+        subscribed = asyncio.get_running_loop().create_future()
+        self.tasks = [asyncio.create_task(self._subscribe(subscribed)), asyncio.create_task(self._publish())]
+        await subscribed
+
+    def _send(self, body: str):
+        self.outbox.put_nowait(body)
+
+    async def _subscribe(self, subscribed: asyncio.Future):
+        while True:
+            try:
+                reader, writer = await self._open()
+                writer.write(self.command("SUBSCRIBE", self.channel))
+                await writer.drain()
+                await self.read_reply(reader)  # ["subscribe", channel, 1]
+                if not subscribed.done():
+                    subscribed.set_result(None)
+                while True:
+                    reply = await self.read_reply(reader)
+                    if isinstance(reply, list) and reply[0] == "message":
+                        self._receive((reply[2],))
+            except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                if not subscribed.done():
+                    subscribed.set_exception(e)
+                    return
+                backplane_stats["errors"] += 1
+                self.reconnects += 1
+                logger.error(f"Backplane subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+
+    async def _publish(self):
+        reader = writer = None
+        while True:
+            bodies = [await self.outbox.get()]
+            while not self.outbox.empty():
+                bodies.append(self.outbox.get_nowait())
+            try:
+                if writer is None:
+                    reader, writer = await self._open()
+                # Pipelined: write the whole batch, then collect one reply per PUBLISH
+                writer.write(b"".join(self.command("PUBLISH", self.channel, body) for body in bodies))
+                await writer.drain()
+                for _ in bodies:
+                    await self.read_reply(reader)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                backplane_stats["errors"] += 1
+                logger.error(f"Backplane publish failed ({len(bodies)} events lost): {e}")
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+
+    async def close(self):
+        if self.outbox is not None:
+            # Give events published during shutdown (e.g. presence) a moment to go out
+            for _ in range(20):
+                if self.outbox.empty():
+                    break
+                await asyncio.sleep(0.01)
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def stats(self) -> dict:
+        return {**super().stats(), "url": self.url, "channel": self.channel, "reconnects": self.reconnects,
+                "queued": self.outbox.qsize() if self.outbox else 0}
+
+
+def create_backplane(url: str = BACKPLANE_URL, workers: int = THREEWAYCHAT_WORKERS) -> LocalBackplane:
+    """Pick the backplane for BACKPLANE_URL; several workers without one share a SQLite file"""
+    if not url:
+        url = f"sqlite:///{BACKPLANE_DB_PATH}" if workers > 1 else "local"
+    if url == "local":
+        return LocalBackplane()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackplane(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "unix://")):
+        return RedisBackplane(url)
+    raise ValueError(f"Unsupported BACKPLANE_URL {url!r}")
+
+
+# permessage-deflate on /ws/phone and /ws/cursor (needs `python cloud_server.py`,
+# which runs uvicorn with DeflateWebSocketProtocol)
+WS_DEFLATE_ENABLED = os.getenv("WS_DEFLATE_ENABLED", "true").lower() == "true"
+WS_DEFLATE_THRESHOLD = int(os.getenv("WS_DEFLATE_THRESHOLD", 256))  # Smaller messages are sent uncompressed
+WS_DEFLATE_LEVEL = int(os.getenv("WS_DEFLATE_LEVEL", 6))  # zlib level, 1 (fast) to 9 (small)
+WS_DEFLATE_WINDOW_BITS = int(os.getenv("WS_DEFLATE_WINDOW_BITS", 15))  # 9-15; smaller saves memory per connection
+
+deflate_stats = {"connections": 0, "compressed": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0}
+
+
+class ThresholdPerMessageDeflate(PerMessageDeflate):
+    """permessage-deflate that leaves small messages uncompressed and counts its cost.
+
+    RFC 7692 marks compression per message (RSV1), so skipping one doesn't
+    disturb the shared compression context.
+    """
+
+    def encode(self, frame: frames.Frame) -> frames.Frame:
+        if frame.opcode in frames.CTRL_OPCODES:
+            return frame
+        if frame.opcode is not frames.OP_CONT and frame.fin and len(frame.data) < WS_DEFLATE_THRESHOLD:
+            deflate_stats["skipped"] += 1
+            return frame
+        started = time.perf_counter()
+        encoded = super().encode(frame)
+        deflate_stats["cpu_seconds"] += time.perf_counter() - started
+        deflate_stats["compressed"] += 1
+        deflate_stats["bytes_in"] += len(frame.data)
+        deflate_stats["bytes_out"] += len(encoded.data)
+        return encoded
+
+
+class ThresholdDeflateFactory(ServerPerMessageDeflateFactory):
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        deflate_stats["connections"] += 1
+        return response_params, ThresholdPerMessageDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            self.compress_settings
+        )
+
+
+class DeflateWebSocketProtocol(WebSocketProtocol):
+    """uvicorn's websockets protocol with our configured permessage-deflate"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.available_extensions = [
+            ThresholdDeflateFactory(
+                server_max_window_bits=WS_DEFLATE_WINDOW_BITS,
+                compress_settings={"level": WS_DEFLATE_LEVEL}
+            )
+        ] if WS_DEFLATE_ENABLED else []
+
+
+def get_compression_stats() -> dict:
+    saved = deflate_stats["bytes_in"] - deflate_stats["bytes_out"]
+    return {
+        "enabled": WS_DEFLATE_ENABLED,
+        "threshold": WS_DEFLATE_THRESHOLD,
+        "level": WS_DEFLATE_LEVEL,
+        "window_bits": WS_DEFLATE_WINDOW_BITS,
+        **{k: v for k, v in deflate_stats.items() if k != "cpu_seconds"},
+        "bytes_saved": saved,
+        "ratio": round(deflate_stats["bytes_out"] / deflate_stats["bytes_in"], 3) if deflate_stats["bytes_in"] else None,
+        "cpu_ms": round(deflate_stats["cpu_seconds"] * 1000, 3),
+        "bytes_saved_per_cpu_ms": round(saved / (deflate_stats["cpu_seconds"] * 1000)) if deflate_stats["cpu_seconds"] else None
+    }
+
+
+# Server-side voice activity detection for /ws/phone/audio (16-bit mono PCM)
+AUDIO_SAMPLE_RATE = int(os.getenv("AUDIO_SAMPLE_RATE", 16000))  # Default when the client doesn't pass ?rate=
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", 20))
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", 9))  # Frame energy above the noise floor that counts as voice
+VAD_MIN_DB = float(os.getenv("VAD_MIN_DB", -55))  # Never call anything quieter than this speech
+VAD_MAX_ZCR = float(os.getenv("VAD_MAX_ZCR", 0.35))  # Noisier frames need twice the energy margin
+VAD_SPEECH_START_MS = int(os.getenv("VAD_SPEECH_START_MS", 60))  # Voiced run before speech_start
+VAD_HANGOVER_MS = int(os.getenv("VAD_HANGOVER_MS", 600))  # Silence before speech_end (the app waited 5 s)
+
+audio_stats = {"streams": 0, "bytes": 0, "speech_segments": 0}
+
+
+class VoiceActivityDetector:
+    """Energy + zero-crossing VAD with an adaptive noise floor.
+
+    Each buffer is cut into VAD_FRAME_MS frames and scored in one pass of
+    array operations; only runs of speech/silence frames are walked in Python
+    to drive the start/end state machine. Samples that don't fill a frame are
+    carried over to the next buffer, as is the odd byte of a buffer that splits
+    a sample.
+    """
+
+    def __init__(self, sample_rate: int = AUDIO_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.frame_len = sample_rate * VAD_FRAME_MS // 1000
+        self.start_frames = max(VAD_SPEECH_START_MS // VAD_FRAME_MS, 1)
+        self.hangover_frames = max(VAD_HANGOVER_MS // VAD_FRAME_MS, 1)
+        self.pending = np.empty(0, dtype=np.int16)
+        self.pending_byte = b""
+        self.noise_floor: Optional[float] = None  # dBFS
+        self.in_speech = False
+        self.speech_run = 0
+        self.silence_run = 0
+        self.speech_started = 0
+        self.frames_seen = 0
+
+    def frame_features(self, samples) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Energy (dBFS) and zero-crossing rate of every whole frame in samples"""
+        count = len(samples) // self.frame_len
+        frames = samples[:count * self.frame_len].reshape(count, self.frame_len).astype(np.float32)
+        frames *= 1 / 32768
+        energy = np.einsum("ij,ij->i", frames, frames) / self.frame_len
+        energy_db = 10 * np.log10(energy + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_len - 1)
+        return energy_db, zcr
+
+    def feed(self, pcm: bytes) -> List[dict]:
+        """Score a buffer of little-endian int16 PCM; returns speech_start/speech_end events"""
+        if self.pending_byte:
+            pcm = self.pending_byte + pcm
+        self.pending_byte = pcm[len(pcm) - len(pcm) % 2:]
+        samples = np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2)
+        if self.pending.size:
+            samples = np.concatenate((self.pending, samples))
+        count = len(samples) // self.frame_len
+        self.pending = samples[count * self.frame_len:].copy()
+        if count == 0:
+            return []
+
+        energy_db, zcr = self.frame_features(samples)
+        if self.noise_floor is None:
+            self.noise_floor = max(float(np.percentile(energy_db, 10)), VAD_MIN_DB - VAD_THRESHOLD_DB)
+        margin = energy_db - self.noise_floor
+        speech = (energy_db > VAD_MIN_DB) & (margin > VAD_THRESHOLD_DB) & (
+            (zcr < VAD_MAX_ZCR) | (margin > 2 * VAD_THRESHOLD_DB))
+        self._adapt_noise_floor(energy_db[~speech])
+
+        events = []
+        edges = np.flatnonzero(speech[1:] != speech[:-1]) + 1
+        starts = [0, *edges.tolist()]
+        ends = [*edges.tolist(), count]
+        for start, end in zip(starts, ends):
+            length = end - start
+            if speech[start]:
+                self.silence_run = 0
+                if not self.in_speech:
+                    run_start = self.frames_seen + start - self.speech_run
+                    self.speech_run += length
+                    if self.speech_run >= self.start_frames:
+                        self.in_speech = True
+                        self.speech_started = run_start
+                        events.append({"type": "speech_start", "at_ms": run_start * VAD_FRAME_MS})
+            else:
+                self.speech_run = 0
+                if self.in_speech:
+                    silence_start = self.frames_seen + start - self.silence_run
+                    self.silence_run += length
+                    if self.silence_run >= self.hangover_frames:
+                        self.in_speech = False
+                        self.silence_run = 0
+                        events.append({
+                            "type": "speech_end",
+                            "at_ms": silence_start * VAD_FRAME_MS,
+                            "duration_ms": (silence_start - self.speech_started) * VAD_FRAME_MS
+                        })
+        self.frames_seen += count
+        return events
+
+    def _adapt_noise_floor(self, quiet_db):
+        # Drop straight to a quieter floor, creep up slowly so speech can't drag it along
+        if quiet_db.size == 0:
+            return
+        level = float(np.median(quiet_db))
+        if level < self.noise_floor:
+            self.noise_floor = level
+        else:
+            self.noise_floor += 0.05 * (level - self.noise_floor)
+
+
+# Shared upstream HTTP client, created in the app lifespan
+http_session: Optional[aiohttp.ClientSession] = None
+
+# Upstream pool usage, counted here rather than read from the connector's private state
+upstream_pool_stats = {"in_use": 0, "opened": 0, "reused": 0}
+
+
+async def _on_connection_create_end(session, context, params):
+    upstream_pool_stats["opened"] += 1
+
+
+async def _on_connection_reuseconn(session, context, params):
+    upstream_pool_stats["reused"] += 1
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the shared Grok HTTP session, creating it if the lifespan hasn't yet"""
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=GROK_POOL_LIMIT,
+            limit_per_host=GROK_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=GROK_DNS_CACHE_TTL,
+            keepalive_timeout=GROK_KEEPALIVE_TIMEOUT
+        )
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(_on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+        http_session = aiohttp.ClientSession(
+            connector=connector,
+            trace_configs=[trace_config],
+            timeout=aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=GROK_CONNECT_TIMEOUT,
+                sock_read=GROK_READ_TIMEOUT
+            ),
+            headers={"Content-Type": "application/json"}
+        )
+        logger.info(f"🔌 Upstream HTTP pool ready (limit: {GROK_POOL_LIMIT}, per host: {GROK_POOL_LIMIT_PER_HOST})")
+    return http_session
+
+
+async def close_http_session():
+    global http_session
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+        logger.info("🔌 Upstream HTTP pool closed")
+    http_session = None
+
+
+@asynccontextmanager
+async def upstream_post(url: str, **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+    """POST on the shared session, counting the request as in use until its body is done"""
+    upstream_pool_stats["in_use"] += 1
+    try:
+        async with get_http_session().post(url, **kwargs) as response:
+            yield response
+    finally:
+        upstream_pool_stats["in_use"] -= 1
+
+
+def get_upstream_pool_stats() -> dict:
+    """Snapshot of upstream connection pool utilisation"""
+    is_open = http_session is not None and not http_session.closed
+    limit = http_session.connector.limit if is_open else GROK_POOL_LIMIT
+    limit_per_host = http_session.connector.limit_per_host if is_open else GROK_POOL_LIMIT_PER_HOST
+    in_use = upstream_pool_stats["in_use"]
+    return {
+        "open": is_open,
+        "limit": limit,
+        "limit_per_host": limit_per_host,
+        "in_use": in_use,
+        "utilisation": round(in_use / limit, 3) if limit else None,
+        "connections_opened": upstream_pool_stats["opened"],
+        "connections_reused": upstream_pool_stats["reused"]
+    }
+
+
+# Durable log behind add_to_knowledge_base, opened in the app lifespan
+conversation_store: Optional[ConversationStore] = None
+
+
+async def open_conversation_store():
+    """Open the durable log and replay its recent window into the sessions"""
+    global conversation_store
+    if not CONVERSATION_DB_PATH:
+        return
+    store = await asyncio.to_thread(ConversationStore, CONVERSATION_DB_PATH)
+    rows = await asyncio.to_thread(store.load_recent)
+    for session_id, seq, sender, content, message_type, created in rows:
+        manager.get_session(session_id).restore_entry(seq, sender, content, message_type, created)
+    store.start()
+    conversation_store = store
+    logger.info(f"💾 Conversation store ready: {CONVERSATION_DB_PATH} ({len(rows)} messages replayed)")
+
+
+async def close_conversation_store():
+    global conversation_store
+    store, conversation_store = conversation_store, None
+    if store is not None:
+        await asyncio.to_thread(store.close)
+        logger.info(f"💾 Conversation store closed ({store.written} messages written)")
+
+
+# Carries routing, knowledge base and presence between workers; replaced in the app lifespan
+backplane: LocalBackplane = LocalBackplane()
+
+
+def handle_backplane_event(event: dict):
+    """Apply an event another worker published"""
+    global CURRENT_GROK_MODEL
+    kind = event.get("kind")
+    worker = event["origin"]
+    if kind == "frame":
+        session = manager.find_session(event["session"])
+        if session is not None and session.deliver(event["role"], event["payload"]):
+            backplane_stats["delivered"] += 1
+        else:
+            backplane_stats["undeliverable"] += 1
+    elif kind in ("kb", "presence"):
+        try:
+            session = manager.get_session(event["session"])
+        except SessionLimitReached:
+            backplane_stats["undeliverable"] += 1
+            return
+        if kind == "kb":
+            session.apply_shared_message(Message(
+                sender=event["sender"], content=event["content"],
+                message_type=event["message_type"], timestamp=event["timestamp"]),
+                event["seq"], worker == WORKER_ID)
+        else:
+            session.set_remote_role(event["role"], worker, event["connected"])
+    elif kind == "cursor_reply":
+        session = manager.find_session(event["session"])
+        if session is not None:
+            session.resolve_cursor_query(event.get("query_id"), event["content"])
+    elif kind == "model":
+        CURRENT_GROK_MODEL = event["model"]
+        logger.info(f"🔄 Model changed to: {CURRENT_GROK_MODEL} (by worker {worker})")
+        asyncio.create_task(manager.broadcast(event["payload"]))
+    elif kind == "hello":
+        # A worker just started: tell it who is connected here
+        for session in manager.sessions.values():
+            if session.phone_connection is not None:
+                session.publish("presence", role="phone", connected=True)
+            if session.cursor_connection is not None:
+                session.publish("presence", role="cursor", connected=True)
+    elif kind == "bye":
+        for session in manager.sessions.values():
+            for role in [role for role, owner in session.remote_roles.items() if owner == worker]:
+                session.set_remote_role(role, worker, False)
+
+
+async def open_backplane() -> List[dict]:
+    """Subscribe before the log is replayed; events that arrive meanwhile are
+    returned for catch_up_backplane"""
+    global backplane
+    early: List[dict] = []
+    candidate = create_backplane()
+    await candidate.start(early.append)
+    backplane = candidate
+    if backplane.shared:
+        # Let other workers' in-flight messages reach the log before we replay it
+        await asyncio.sleep(2 * STORE_FLUSH_INTERVAL + BACKPLANE_POLL_INTERVAL)
+    return early
+
+
+def catch_up_backplane(early: List[dict]):
+    """Apply events that arrived during replay, skipping messages the log already had"""
+    for event in early:
+        if event.get("kind") == "kb":
+            session = manager.find_session(event["session"])
+            if session is not None and session.has_logged(event["sender"], event["content"], event["timestamp"]):
+                continue
+        handle_backplane_event(event)
+    backplane.handler = handle_backplane_event
+    if backplane.shared:
+        backplane.publish({"kind": "hello"})
+    logger.info(f"🛰️ Backplane ready: {backplane.name} (worker {WORKER_ID}, {len(early)} events caught up)")
+
+
+async def close_backplane():
+    global backplane
+    if backplane.shared:
+        backplane.publish({"kind": "bye"})
+    await backplane.close()
+    backplane = LocalBackplane()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_http_session()
+    early_events = await open_backplane()
+    await open_conversation_store()
+    catch_up_backplane(early_events)
+    try:
+        yield
+    finally:
+        await close_backplane()
+        await close_conversation_store()
+        await close_http_session()
+
+
 # Initialize FastAPI app and connection manager
-app = FastAPI(title="ThreeWayChat Cloud Server")
+app = FastAPI(title="ThreeWayChat Cloud Server", lifespan=lifespan)
 manager = ConnectionManager()
 
 # Add CORS middleware
@@ -323,75 +2538,587 @@ app.add_middleware(
 )
 
 
-async def call_grok_api(message: str, context: str = "") -> str:
-    """Call Grok AI API with the given message"""
-
-    if not GROK_API_KEY:
-        logger.error("GROK_API_KEY not set - using smart fallback response")
-        # Smart fallback based on context
-        if "debug" in message.lower() or "error" in message.lower():
-            return "I can see you're debugging something! Once my API key is configured, I'll be able to provide detailed assistance. For now, Cursor is helping with the technical details."
-        elif "?" in message:
-            return "I hear your question! I'm Grok AI and I'm ready to help in this three-way conversation with you and Cursor. Just need my API key to be set up properly."
-        else:
-            return "Hello! I'm Grok AI in this three-way chat with you and Cursor. I can see the conversation but need my API key configured to provide full responses."
-
-    # Build messages with history and system prompt
-    history_messages = [
+def grok_fallback_response(message: str) -> str:
+    """Smart fallback used when no API key is configured"""
+    if "debug" in message.lower() or "error" in message.lower():
+        return "I can see you're debugging something! Once my API key is configured, I'll be able to provide detailed assistance. For now, Cursor is helping with the technical details."
+    elif "?" in message:
+        return "I hear your question! I'm Grok AI and I'm ready to help in this three-way conversation with you and Cursor. Just need my API key to be set up properly."
+    else:
+        return "Hello! I'm Grok AI in this three-way chat with you and Cursor. I can see the conversation but need my API key configured to provide full responses."
+
+
+# Prompt tokens sent per model, as estimated by the packer
+prompt_token_stats: Dict[str, dict] = {}
+MESSAGE_TOKEN_OVERHEAD = 4  # Role/formatting tokens per chat message
+MIN_TRUNCATED_TOKENS = 64  # Below this an older entry is dropped rather than truncated
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast token estimate: ~4 characters per token for English and code"""
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    max_chars = tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max(max_chars - 16, 0)] + " …[truncated]"
+
+
+def get_prompt_budget(model: str) -> int:
+    info = GROK_MODELS.get(model, {})
+    budget = info.get("prompt_budget", 8000)
+    window = info.get("context_tokens")
+    if window:
+        budget = min(budget, window - GROK_MAX_TOKENS)
+    return budget
+
+
+def prompt_history(session: Optional[Session], message: str, limit: int = HISTORY_SCAN_LIMIT) -> List[KnowledgeEntry]:
+    """The newest knowledge base entries a prompt for ``message`` draws on, oldest first"""
+    history = session.knowledge_base.recent(limit) if session else []
+    # The phone turn is already the newest knowledge base entry; don't send it twice
+    if history and history[-1].content == message:
+        history = history[:-1]
+    return history
+
+
+def build_grok_messages(message: str, context: str, session: Optional[Session]) -> List[dict]:
+    """Pack the system prompt, history and new message into the model's token budget.
+
+    The system prompt and the new user turn always go in (truncated if they
+    alone overflow). The latest Cursor reply is kept next, then history is
+    filled newest-first; the entry that no longer fits is truncated, or dropped
+    if too little room is left, and everything older is dropped.
+    """
+    budget = get_prompt_budget(CURRENT_GROK_MODEL)
+
+    history = prompt_history(session, message)
+
+    system_tokens = min(estimate_tokens(context), budget // 2)
+    context = truncate_to_tokens(context, system_tokens)
+    message_tokens = min(estimate_tokens(message), budget // 4)
+    message = truncate_to_tokens(message, message_tokens)
+    remaining = budget - system_tokens - message_tokens - 2 * MESSAGE_TOKEN_OVERHEAD
+
+    chosen: Dict[int, str] = {}
+
+    def take(index: int) -> bool:
+        nonlocal remaining
+        content = history[index].content
+        cost = estimate_tokens(content) + MESSAGE_TOKEN_OVERHEAD
+        if cost <= remaining:
+            chosen[index] = content
+            remaining -= cost
+            return True
+        if remaining - MESSAGE_TOKEN_OVERHEAD >= MIN_TRUNCATED_TOKENS:
+            chosen[index] = truncate_to_tokens(content, remaining - MESSAGE_TOKEN_OVERHEAD)
+            remaining = 0
+        return False
+
+    latest_cursor = next((i for i in range(len(history) - 1, -1, -1) if history[i].sender == "cursor"), None)
+    if latest_cursor is not None:
+        take(latest_cursor)
+    for index in range(len(history) - 1, -1, -1):
+        if index in chosen:
+            continue
+        if remaining <= MESSAGE_TOKEN_OVERHEAD or not take(index):
+            break
+
+    prompt_tokens = budget - remaining
+    stats = prompt_token_stats.setdefault(CURRENT_GROK_MODEL, {"requests": 0, "total": 0, "max": 0, "last": 0})
+    stats["requests"] += 1
+    stats["total"] += prompt_tokens
+    stats["last"] = prompt_tokens
+    stats["max"] = max(stats["max"], prompt_tokens)
+    PROMPT_TOKENS.observe(prompt_tokens, CURRENT_GROK_MODEL)
+
+    return [
         {"role": "system", "content": context},
     ] + [
-        {"role": "user" if msg.sender ==
-            "phone" else "assistant", "content": msg.content}
-        for msg in manager.knowledge_base[-10:]  # Last 10 messages for context
+        {"role": "user" if history[index].sender ==
+            "phone" else "assistant", "content": chosen[index]}
+        for index in sorted(chosen)
     ] + [
         {"role": "user", "content": message}
     ]
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
+
+# Grok response cache
+GROK_CACHE_ENABLED = os.getenv("GROK_CACHE_ENABLED", "true").lower() == "true"
+GROK_CACHE_TTL = float(os.getenv("GROK_CACHE_TTL", 300))  # Seconds
+GROK_CACHE_MAX_ENTRIES = int(os.getenv("GROK_CACHE_MAX_ENTRIES", 1024))
+GROK_CACHE_MAX_BYTES = int(os.getenv("GROK_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+GROK_CACHE_SHARED = os.getenv("GROK_CACHE_SHARED", "false").lower() == "true"  # Share hits across sessions
+GROK_CACHE_HISTORY_TURNS = int(os.getenv("GROK_CACHE_HISTORY_TURNS", 2))  # Prompt history entries in the key
+CACHE_TRAILING_PUNCTUATION = " .,;:!?…。、？！"
+
+
+def normalize_for_cache(message: str) -> str:
+    """Casefold, collapse whitespace and trim trailing punctuation so trivial variants match.
+
+    Nothing inside the text is dropped: letters in any script, digits and
+    symbols such as operators all still tell questions apart.
+    """
+    return " ".join(message.casefold().split()).rstrip(CACHE_TRAILING_PUNCTUATION)
+
+
+class ResponseCache:
+    """LRU cache of successful Grok completions, bounded by entries, bytes and TTL"""
+
+    def __init__(self, ttl: float = GROK_CACHE_TTL, max_entries: int = GROK_CACHE_MAX_ENTRIES,
+                 max_bytes: int = GROK_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key_for(self, message: str, session: Optional[Session]) -> str:
+        """Hash of the normalised message, the session's relevant context, the
+        turns just before it in the prompt and the model.
+
+        The history tail keeps follow-ups such as "tell me more" from sharing
+        an answer across topics.
+        """
+        scope = "" if GROK_CACHE_SHARED or session is None else session.session_id
+        context = session.cache_context_digest() if session else ""
+        tail = prompt_history(session, message, GROK_CACHE_HISTORY_TURNS + 1)[-GROK_CACHE_HISTORY_TURNS:]
+        recent = "\x1e".join(f"{entry.sender}:{entry.content}" for entry in tail) if GROK_CACHE_HISTORY_TURNS else ""
+        raw = "\x1f".join((CURRENT_GROK_MODEL, scope, context, recent, normalize_for_cache(message)))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        item = self.entries.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires, response = item
+        if expires < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, key: str, response: str):
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.monotonic() + self.ttl, response)
+        self.bytes += len(response)
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, response = self.entries.pop(key)
+        self.bytes -= len(response)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None
+        }
+
+
+grok_cache = ResponseCache()
+
+
+class SingleFlight:
+    """Coalesce identical in-flight upstream requests onto one shared task.
+
+    Each caller awaits the shared task through ``asyncio.shield``, so one caller
+    being cancelled doesn't cancel it for the rest; the task is only cancelled
+    once every caller has gone.
+    """
+
+    class Flight:
+        __slots__ = ("task", "waiters")
+
+        def __init__(self, task: asyncio.Task):
+            self.task = task
+            self.waiters = 0
+
+    def __init__(self):
+        self.flights: Dict[str, "SingleFlight.Flight"] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def fingerprint(payload: dict) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+    async def run(self, key: str, factory):
+        flight = self.flights.get(key)
+        if flight is None or flight.task.done():
+            flight = self.Flight(asyncio.create_task(factory()))
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _task, flight=flight: self._finished(key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def _finished(self, key: str, flight: "SingleFlight.Flight"):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self.flights), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+grok_flights = SingleFlight()
+
+
+class UpstreamBusy(Exception):
+    """Raised instead of calling Grok when the upstream limiter sheds the call"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class UpstreamLimiter:
+    """Caps concurrent Grok calls, with a bounded FIFO of callers waiting for a slot.
+
+    A call that finds the wait queue full, or waits longer than ``timeout``,
+    raises UpstreamBusy straight away so the client gets a busy frame rather
+    than a reply that arrives after it stopped listening.
+    """
+
+    def __init__(self, limit: int = UPSTREAM_CONCURRENCY, queue_size: int = UPSTREAM_QUEUE_SIZE,
+                 timeout: float = UPSTREAM_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+
+    @asynccontextmanager
+    async def slot(self, model: str):
+        await self.acquire(model)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, model: str):
+        if not self.limit or (self.in_flight < self.limit and not self.waiters):
+            self.in_flight += 1
+            self.admitted += 1
+            UPSTREAM_QUEUE_WAIT_SECONDS.observe(0.0, model)
+            return
+        if len(self.waiters) >= self.queue_size:
+            self._reject("queue_full")
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # A slot was handed over just as we gave up
+            else:
+                waiter.cancel()
+                self.waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject("queue_timeout")
+        self.admitted += 1
+        UPSTREAM_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - started, model)
+
+    def release(self):
+        # Hand the slot straight to the oldest waiter so newcomers can't overtake it
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _reject(self, reason: str):
+        self.rejected[reason] += 1
+        ADMISSION_REJECTIONS_TOTAL.inc(f"upstream_{reason}")
+        raise UpstreamBusy(reason, self.timeout if reason == "queue_timeout" else 1.0)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self.waiters),
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected
+        }
+
+
+upstream_limiter = UpstreamLimiter()
+
+
+async def post_grok_completion(payload: dict) -> Tuple[str, bool]:
+    """POST one non-streaming completion; returns the text and whether it succeeded"""
+    model = payload["model"]
+    async with upstream_limiter.slot(model):
+        started = time.perf_counter()
+        try:
+            async with upstream_post(
                 GROK_API_URL,
-                headers={
-                    "Authorization": f"Bearer {GROK_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": CURRENT_GROK_MODEL,
-                    "messages": history_messages,
-                    "temperature": 0.7,
-                    "max_tokens": 1000  # Increased for better responses
-                }
+                headers={"Authorization": f"Bearer {GROK_API_KEY}"},
+                json=payload
             ) as response:
+                UPSTREAM_TTFB_SECONDS.observe(time.perf_counter() - started, model, "complete")
                 if response.status != 200:
                     error_text = await response.text()
                     logger.error(f"Grok API error: {response.status} - {error_text}")
-                    logger.error(f"Using model: {CURRENT_GROK_MODEL}")
+                    logger.error(f"Using model: {payload['model']}")
                     logger.error(f"API Key length: {len(GROK_API_KEY) if GROK_API_KEY else 0}")
-                    return "Sorry, there was an error processing your request."
+                    UPSTREAM_ERRORS_TOTAL.inc(model, "complete")
+                    return "Sorry, there was an error processing your request.", False
 
                 data = await response.json()
+                UPSTREAM_DURATION_SECONDS.observe(time.perf_counter() - started, model, "complete")
                 if "choices" in data and data["choices"]:
-                    return data["choices"][0]["message"]["content"].strip()
+                    return data["choices"][0]["message"]["content"].strip(), True
                 else:
                     logger.error("Invalid API response")
-                    return "Sorry, I couldn't generate a response."
-    except Exception as e:
-        logger.error(f"Exception calling Grok API: {e}")
-        logger.error(f"Model: {CURRENT_GROK_MODEL}, API Key length: {len(GROK_API_KEY) if GROK_API_KEY else 0}")
-        return "Sorry, there was an error processing your request."
+                    UPSTREAM_ERRORS_TOTAL.inc(model, "complete")
+                    return "Sorry, I couldn't generate a response.", False
+        except Exception as e:
+            logger.error(f"Exception calling Grok API: {e}")
+            logger.error(f"Model: {payload['model']}, API Key length: {len(GROK_API_KEY) if GROK_API_KEY else 0}")
+            UPSTREAM_ERRORS_TOTAL.inc(model, "complete")
+            return "Sorry, there was an error processing your request.", False
+
+
+async def call_grok_api(message: str, context: str = "", session: Optional[Session] = None,
+                        use_cache: bool = True) -> str:
+    """Call Grok AI API with the given message and the session's recent history.
+
+    Successful completions are cached unless ``use_cache`` is False; fallback
+    and error replies never are. Identical requests already in flight share
+    one upstream call. Raises UpstreamBusy when the call is shed.
+    """
+
+    if not GROK_API_KEY:
+        logger.error("GROK_API_KEY not set - using smart fallback response")
+        FALLBACK_RESPONSES_TOTAL.inc(CURRENT_GROK_MODEL)
+        return grok_fallback_response(message)
+
+    cache_key = grok_cache.key_for(message, session) if use_cache and GROK_CACHE_ENABLED else None
+    if cache_key:
+        cached = grok_cache.get(cache_key)
+        if cached is not None:
+            logger.info("⚡ Grok response served from cache")
+            return cached
+
+    payload = {
+        "model": CURRENT_GROK_MODEL,
+        "messages": build_grok_messages(message, context, session),
+        "temperature": 0.7,
+        "max_tokens": GROK_MAX_TOKENS
+    }
+    content, ok = await grok_flights.run(
+        SingleFlight.fingerprint(payload), lambda: post_grok_completion(payload))
+    if ok and cache_key:
+        grok_cache.put(cache_key, content)
+    return content
+
+
+async def stream_grok_api(message: str, context: str = "", session: Optional[Session] = None,
+                          use_cache: bool = True) -> AsyncIterator[str]:
+    """Call Grok AI API with stream=true and yield content deltas as they arrive.
+
+    Errors are yielded as the same apology text call_grok_api returns, so callers
+    can treat both paths alike. A cache hit is yielded as a single delta.
+    Raises UpstreamBusy before the first delta when the call is shed.
+    """
+    if not GROK_API_KEY:
+        logger.error("GROK_API_KEY not set - using smart fallback response")
+        FALLBACK_RESPONSES_TOTAL.inc(CURRENT_GROK_MODEL)
+        yield grok_fallback_response(message)
+        return
+
+    cache_key = grok_cache.key_for(message, session) if use_cache and GROK_CACHE_ENABLED else None
+    if cache_key:
+        cached = grok_cache.get(cache_key)
+        if cached is not None:
+            logger.info("⚡ Grok response served from cache")
+            yield cached
+            return
+
+    history_messages = build_grok_messages(message, context, session)
+    received_any = False
+    finished = False  # Saw [DONE] or a finish_reason, i.e. the stream wasn't cut short
+    parts = []
+    model = CURRENT_GROK_MODEL
+    async with upstream_limiter.slot(model):
+        started = time.perf_counter()
+        try:
+            async with upstream_post(
+                GROK_API_URL,
+                headers={"Authorization": f"Bearer {GROK_API_KEY}"},
+                json={
+                    "model": CURRENT_GROK_MODEL,
+                    "messages": history_messages,
+                    "temperature": 0.7,
+                    "max_tokens": GROK_MAX_TOKENS,
+                    "stream": True
+                }
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"Grok API stream error: {response.status} - {error_text}")
+                    logger.error(f"Using model: {CURRENT_GROK_MODEL}")
+                    UPSTREAM_ERRORS_TOTAL.inc(model, "stream")
+                    yield "Sorry, there was an error processing your request."
+                    return
+
+                # Server-sent events: one "data: {...}" line per delta, "data: [DONE]" at the end
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8", errors="replace").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        finished = True
+                        break
+                    try:
+                        event = json.loads(payload)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping malformed Grok stream event: {payload[:100]}")
+                        continue
+                    choices = event.get("choices") or []
+                    delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                    if choices and choices[0].get("finish_reason"):
+                        finished = True
+                    if delta:
+                        if not received_any:
+                            UPSTREAM_TTFB_SECONDS.observe(time.perf_counter() - started, model, "stream")
+                        received_any = True
+                        parts.append(delta)
+                        yield delta
+        except Exception as e:
+            logger.error(f"Exception streaming Grok API: {e}")
+            logger.error(f"Model: {CURRENT_GROK_MODEL}, API Key length: {len(GROK_API_KEY) if GROK_API_KEY else 0}")
+            UPSTREAM_ERRORS_TOTAL.inc(model, "stream")
+            if not received_any:
+                yield "Sorry, there was an error processing your request."
+            return
+
+    UPSTREAM_DURATION_SECONDS.observe(time.perf_counter() - started, model, "stream")
+    if not received_any:
+        logger.error("Invalid API stream response")
+        UPSTREAM_ERRORS_TOTAL.inc(model, "stream")
+        yield "Sorry, I couldn't generate a response."
+    elif not finished:
+        # Connection closed mid-answer: keep what was relayed, but don't cache a truncated reply
+        logger.warning("Grok stream ended without [DONE] or finish_reason")
+        UPSTREAM_ERRORS_TOTAL.inc(model, "stream")
+    elif cache_key:
+        grok_cache.put(cache_key, "".join(parts).strip())
+
+
+class SentenceChunker:
+    """Accumulates streamed text and cuts it into sentence-sized pieces for TTS"""
+
+    BOUNDARY = re.compile(r'[.!?…]+["\')\]]*\s+|\n+')
+
+    def __init__(self, min_chars: int = STREAM_MIN_CHUNK_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """Add text and return any complete sentences it finished"""
+        self.buffer += text
+        chunks = []
+        start = 0
+        for match in self.BOUNDARY.finditer(self.buffer):
+            if match.end() - start < self.min_chars:
+                continue
+            chunk = self.buffer[start:match.end()].strip()
+            if chunk:
+                chunks.append(chunk)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return chunks
+
+    def flush(self) -> Optional[str]:
+        """Return whatever is left once the stream has finished"""
+        chunk = self.buffer.strip()
+        self.buffer = ""
+        return chunk or None
+
+
+async def relay_grok_stream(session: Session, stream_id: str, message: str, context: str,
+                            use_cache: bool = True) -> tuple:
+    """Stream a Grok completion to the phone as message_chunk frames.
+
+    Returns the assembled text and the next sequence number. Once a
+    [CURSOR_QUERY] tag starts appearing, nothing more is relayed so the
+    query itself is never spoken.
+    """
+    chunker = SentenceChunker()
+    parts = []
+    seq = 0
+    relaying = True
+
+    async for delta in stream_grok_api(message, context, session, use_cache):
+        parts.append(delta)
+        if not relaying:
+            continue
+        for chunk in chunker.feed(delta):
+            if "[CURSOR_QUERY" in chunk:
+                relaying = False
+                break
+            await session.send_to_phone(stream_chunk_frame(session, stream_id, seq, chunk))
+            seq += 1
+
+    if relaying:
+        tail = chunker.flush()
+        if tail and "[CURSOR_QUERY" not in tail:
+            await session.send_to_phone(stream_chunk_frame(session, stream_id, seq, tail))
+            seq += 1
+
+    return "".join(parts).strip(), seq
+
+
+def stream_chunk_frame(session: Session, stream_id: str, seq: int, content: str) -> dict:
+    return {
+        "type": "message_chunk",
+        "sender": "grok",
+        "stream_id": stream_id,
+        "seq": seq,
+        "content": content,
+        "timestamp": session.get_timestamp()
+    }
 
 
 def is_programming_question(content: str) -> bool:
     """Detect if a message is a programming question"""
-    programming_keywords = [
-        "code", "program", "function", "class", "bug", "error", "debug",
-        "python", "javascript", "swift", "java", "c++", "sql", "api",
-        "algorithm", "data structure", "framework", "library", "git",
-        "deploy", "server", "database", "frontend", "backend", "fullstack"
-    ]
-
-    content_lower = content.lower()
-    return any(keyword in content_lower for keyword in programming_keywords)
+    return analyze_message(content, max_terms=0).is_programming
 
 
 @app.get("/")
@@ -400,10 +3127,8 @@ async def root():
     return {
         "message": "ThreeWayChat Cloud Server",
         "status": "running",
-        "connections": {
-            "phone": manager.phone_connection is not None,
-            "cursor": manager.cursor_connection is not None
-        },
+        "connections": manager.connection_counts(),
+        "sessions": len(manager.sessions),
         "deployment": "cloud"
     }
 
@@ -414,131 +3139,215 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": manager.get_timestamp(),
-        "connections": {
-            "phone": manager.phone_connection is not None,
-            "cursor": manager.cursor_connection is not None
+        "connections": manager.connection_counts(),
+        "sessions": len(manager.sessions),
+        "upstream_pool": get_upstream_pool_stats(),
+        "knowledge_base": {
+            "entries": sum(len(s.knowledge_base) for s in manager.sessions.values()),
+            "bytes": sum(s.knowledge_base.stats()["bytes"] for s in manager.sessions.values())
+        },
+        "conversation_store": conversation_store.stats() if conversation_store else None,
+        "prompt_tokens": prompt_token_stats,
+        "response_cache": grok_cache.stats(),
+        "single_flight": grok_flights.stats(),
+        "upstream_limiter": upstream_limiter.stats(),
+        "outbound": manager.outbound_stats(),
+        "compression": get_compression_stats(),
+        "audio": audio_stats,
+        "backplane": backplane.stats(),
+        "cursor_queries": {
+            **cursor_query_stats,
+            "pending": sum(len(s.pending_cursor_queries) for s in manager.sessions.values())
         }
     }
 
 
-@app.websocket("/ws/phone")
-async def websocket_phone(websocket: WebSocket):
-    """WebSocket endpoint for phone connection"""
-    await manager.connect_phone(websocket)
-    try:
-        while True:
-            logger.info("Phone WebSocket: Waiting for message...")
-            data = await websocket.receive_text()
-            logger.info(
-                f"Phone WebSocket: Received data: "
-                f"{data}"
-            )
-            message_data = json.loads(data)
-            logger.info(f"Phone WebSocket: Parsed message: {message_data}")
-
-            # Create message object
-            message = Message(
-                sender="phone",
-                content=message_data.get("content", ""),
-                message_type=message_data.get("type", "text"),
-                timestamp=manager.get_timestamp()
-            )
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of stage latencies, counters and connection gauges"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    counts = manager.connection_counts()
+    lines.append("# HELP threewaychat_active_connections Connected WebSocket clients")
+    lines.append("# TYPE threewaychat_active_connections gauge")
+    for role, count in (("phone", counts["phone"]), ("cursor", counts["cursor"]), ("audio", audio_stats["streams"])):
+        lines.append(f'threewaychat_active_connections{{role="{role}"}} {count}')
+    lines.append("# HELP threewaychat_upstream_in_flight Grok calls holding an upstream slot")
+    lines.append("# TYPE threewaychat_upstream_in_flight gauge")
+    lines.append(f"threewaychat_upstream_in_flight {upstream_limiter.in_flight}")
+    lines.append("# HELP threewaychat_upstream_waiting Grok calls queued for an upstream slot")
+    lines.append("# TYPE threewaychat_upstream_waiting gauge")
+    lines.append(f"threewaychat_upstream_waiting {len(upstream_limiter.waiters)}")
+    lines.append("# HELP threewaychat_upstream_connections_total Upstream connections opened, or reused from the pool")
+    lines.append("# TYPE threewaychat_upstream_connections_total counter")
+    for outcome in ("opened", "reused"):
+        lines.append(f'threewaychat_upstream_connections_total{{outcome="{outcome}"}} {upstream_pool_stats[outcome]}')
+    # permessage-deflate: bytes saved (in - out) against the CPU spent compressing
+    lines.append("# HELP threewaychat_ws_deflate_bytes_total Outbound frame bytes before (in) and after (out) deflate")
+    lines.append("# TYPE threewaychat_ws_deflate_bytes_total counter")
+    for direction in ("in", "out"):
+        lines.append(f'threewaychat_ws_deflate_bytes_total{{direction="{direction}"}} {deflate_stats["bytes_" + direction]}')
+    lines.append("# HELP threewaychat_ws_deflate_cpu_seconds_total Time spent compressing outbound frames")
+    lines.append("# TYPE threewaychat_ws_deflate_cpu_seconds_total counter")
+    lines.append(f'threewaychat_ws_deflate_cpu_seconds_total {deflate_stats["cpu_seconds"]:.6f}')
+    lines.append("# HELP threewaychat_ws_deflate_frames_total Outbound frames compressed, or sent as-is below the threshold")
+    lines.append("# TYPE threewaychat_ws_deflate_frames_total counter")
+    for outcome in ("compressed", "skipped"):
+        lines.append(f'threewaychat_ws_deflate_frames_total{{outcome="{outcome}"}} {deflate_stats[outcome]}')
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/traces")
+async def debug_traces(limit: int = Query(20, ge=1, le=TRACE_BUFFER_SIZE),
+                       session: Optional[str] = Query(None, description="Only this session")):
+    """Slowest and most recent sampled turn traces, with their spans"""
+    return tracer.snapshot(limit, session)
+
+
+@app.get("/connections")
+async def connection_stats(session: Optional[str] = Query(None, description="Only this session")):
+    """Per-connection outbound queue depth and send latency"""
+    if session is not None:
+        found = manager.find_session(session)
+        if found is None:
+            raise HTTPException(status_code=404, detail=f"Unknown session {session}")
+        return {session: found.connection_stats()}
+    return {
+        session_id: s.connection_stats()
+        for session_id, s in manager.sessions.items()
+        if not s.is_idle
+    }
 
-            # Add to knowledge base
-            manager.add_to_knowledge_base(message)
 
-            # Broadcast to cursor
-            logger.info("Broadcasting to cursor")
-            try:
-                await manager.send_to_cursor({
-                    "type": "message",
-                    "sender": "phone",
-                    "content": message.content,
-                    "message_type": message.message_type,
-                    "timestamp": message.timestamp
-                })
-                logger.info("Cursor broadcast sent successfully")
-            except Exception as e:
-                logger.error(f"Error broadcasting to cursor: {e}")
+async def process_phone_turn(session: Session, message_data: dict, trace: Trace):
+    """Run one phone utterance through Grok (and Cursor if Grok asks) and reply.
 
-            # Send processing indicator to phone
-            await manager.send_to_phone({
-                "type": "system",
-                "content": "Grok is thinking...",
-                "timestamp": manager.get_timestamp()
-            })
+    Runs on the session's phone worker so the receive loop stays free; a newer
+    utterance can cancel it mid-flight (barge-in). The worker finishes
+    ``trace``, which started when the receive loop got the message.
+    """
+    # Create message object
+    message = Message(
+        sender="phone",
+        content=message_data.get("content", ""),
+        message_type=message_data.get("type", "text"),
+        timestamp=session.get_timestamp()
+    )
 
-            # Call Grok API with smart context
-            smart_context = manager.get_smart_context_for_grok()
-            grok_response = await call_grok_api(message.content, smart_context)
+    # Add to knowledge base
+    with trace.span("kb_append", sender="phone"):
+        session.add_to_knowledge_base(message)
 
-            # Check for Cursor query tag
-            import re
-            cursor_query_match = re.search(
-                r'\[CURSOR_QUERY\](.*?)\[/CURSOR_QUERY\]',
-                grok_response,
-                re.DOTALL
-            )
-            if cursor_query_match:
-                cursor_query = cursor_query_match.group(1).strip()
-
-                # Send status to phone
-                await manager.send_to_phone({
-                    "type": "system",
-                    "content": "Grok is consulting Cursor AI...",
-                    "timestamp": manager.get_timestamp()
-                })
-
-                # Send query to cursor
-                await manager.send_to_cursor({
-                    "type": "query",
-                    "sender": "grok",
-                    "content": cursor_query,
-                    "timestamp": manager.get_timestamp()
-                })
-
-                # Wait for cursor response (simple timeout-based wait for demo;
-                # improve later)
-                cursor_response = None
-                start_time = datetime.now()
-                while (
-                        datetime.now() -
-                        start_time).seconds < 30:  # 30s timeout
-                    # Check knowledge base for recent cursor message
-                    recent_messages = [
-                        m for m in manager.knowledge_base[-5:] if m.sender == "cursor"]
-                    if recent_messages:
-                        cursor_response = recent_messages[-1].content
-                        break
-                    await asyncio.sleep(1)
-
-                if cursor_response:
-                    # Call Grok again to summarize
-                    summary_prompt = (
-                        f"Summarize this Cursor AI response in simple, "
-                        f"natural language: {cursor_response}. "
-                        "Keep it jargon-free for voice relay."
-                    )
-                    grok_summary = await call_grok_api(summary_prompt, "Summarize for user")
-                    final_response = grok_summary
-                else:
-                    final_response = "Cursor AI didn't respond in time. Here's my direct response: " + grok_response
+    # Broadcast to cursor
+    logger.info("Broadcasting to cursor")
+    try:
+        await session.send_to_cursor({
+            "type": "message",
+            "sender": "phone",
+            "content": message.content,
+            "message_type": message.message_type,
+            "timestamp": message.timestamp
+        })
+        logger.info("Cursor broadcast sent successfully")
+    except Exception as e:
+        logger.error(f"Error broadcasting to cursor: {e}")
+
+    # Send processing indicator to phone
+    await session.send_to_phone(THINKING_FRAME.render(session.get_timestamp()))
+
+    # Call Grok API with smart context
+    with trace.span("context"):
+        smart_context = session.get_smart_context_for_grok()
+    TURN_CONTEXT_SECONDS.observe(time.perf_counter() - trace.started, CURRENT_GROK_MODEL)
+    stream_response = message_data.get("stream", GROK_STREAM_DEFAULT) is True
+    use_cache = message_data.get("cache", True) is not False  # Clients can opt a turn out of the cache
+    stream_id = uuid.uuid4().hex[:12]
+    stream_seq = 0
+    try:
+        with trace.span("upstream", mode="stream" if stream_response else "complete"):
+            if stream_response:
+                grok_response, stream_seq = await relay_grok_stream(
+                    session, stream_id, message.content, smart_context, use_cache)
             else:
-                final_response = grok_response
-
-            # Create final message
-            final_message = Message(
-                sender="grok",
-                content=final_response,
-                message_type="text",
-                timestamp=manager.get_timestamp()
+                grok_response = await call_grok_api(message.content, smart_context, session, use_cache)
+    except UpstreamBusy as busy:
+        await session.send_to_phone(session.busy_frame(busy.reason, busy.retry_after))
+        trace.finish("busy")
+        return
+
+    # Check for Cursor query tag
+    cursor_query_match = re.search(
+        r'\[CURSOR_QUERY\](.*?)\[/CURSOR_QUERY\]',
+        grok_response,
+        re.DOTALL
+    )
+    if cursor_query_match:
+        cursor_query = cursor_query_match.group(1).strip()
+
+        # Send status to phone
+        await session.send_to_phone(CONSULTING_CURSOR_FRAME.render(session.get_timestamp()))
+
+        # Send query to cursor and wait for its correlated reply
+        started = time.perf_counter()
+        cursor_response = await session.ask_cursor(cursor_query)
+        ended = time.perf_counter()
+        CURSOR_WAIT_SECONDS.observe(ended - started, CURRENT_GROK_MODEL)
+        trace.add_span("cursor_wait", started, ended, {"answered": cursor_response is not None})
+
+        if cursor_response:
+            # Call Grok again to summarize
+            summary_prompt = (
+                f"Summarize this Cursor AI response in simple, "
+                f"natural language: {cursor_response}. "
+                "Keep it jargon-free for voice relay."
             )
-
-            # Add to knowledge base
-            manager.add_to_knowledge_base(final_message)
-
-            # Send to phone
-            await manager.send_to_phone({
+            started = time.perf_counter()
+            try:
+                final_response = await call_grok_api(
+                    summary_prompt, "Summarize for user", session, use_cache=False)
+            except UpstreamBusy:
+                # Cursor already answered; relay it as-is rather than drop the turn
+                final_response = f"Cursor says: {cursor_response}"
+            ended = time.perf_counter()
+            SUMMARY_SECONDS.observe(ended - started, CURRENT_GROK_MODEL)
+            trace.add_span("summary", started, ended)
+        else:
+            final_response = "Cursor AI didn't respond in time. Here's my direct response: " + grok_response
+    else:
+        final_response = grok_response
+
+    # Create final message
+    final_message = Message(
+        sender="grok",
+        content=final_response,
+        message_type="text",
+        timestamp=session.get_timestamp()
+    )
+
+    # Add to knowledge base
+    with trace.span("kb_append", sender="grok"):
+        session.add_to_knowledge_base(final_message)
+
+    # Send to phone (queued on its writer; socket time is in /metrics)
+    with trace.span("send"):
+        if stream_response:
+            # Anything not already relayed (Cursor summary, timeout note) goes out as one last chunk
+            if final_response != grok_response or stream_seq == 0:
+                await session.send_to_phone(
+                    stream_chunk_frame(session, stream_id, stream_seq, final_response))
+                stream_seq += 1
+            await session.send_to_phone({
+                "type": "message_end",
+                "sender": "grok",
+                "stream_id": stream_id,
+                "seq": stream_seq,
+                "content": final_response,
+                "message_type": "text",
+                "timestamp": final_message.timestamp
+            })
+        else:
+            await session.send_to_phone({
                 "type": "message",
                 "sender": "grok",
                 "content": final_response,
@@ -546,35 +3355,185 @@ async def websocket_phone(websocket: WebSocket):
                 "timestamp": final_message.timestamp
             })
 
+
+@app.websocket("/ws/phone")
+async def websocket_phone(websocket: WebSocket):
+    """WebSocket endpoint for phone connection"""
+    subprotocol = negotiate_subprotocol(websocket)
+    try:
+        session = await manager.connect_phone(websocket, subprotocol)
+    except SessionLimitReached:
+        await manager.refuse(websocket, subprotocol)
+        return
+    session.start_turn_worker("phone", process_phone_turn)
+    try:
+        while True:
+            logger.info("Phone WebSocket: Waiting for message...")
+            raw = await receive_raw(websocket, subprotocol)
+            trace = Trace("phone", session.session_id)
+            with trace.span("parse", bytes=len(raw)):
+                message_data = decode_message(raw, subprotocol)
+            logger.info(f"Phone WebSocket: Parsed message: {message_data}")
+
+            # Control frames are answered straight from the receive loop
+            message_type = message_data.get("type")
+            if message_type == "ping":
+                await session.send_to_phone({"type": "pong", "timestamp": session.get_timestamp()})
+                continue
+            if message_type == "cancel":
+                session.cancel_turn("phone")
+                continue
+
+            # Everything else is a turn for the worker, if the session has a token left
+            if not session.rate_limit.take():
+                ADMISSION_REJECTIONS_TOTAL.inc("session_rate")
+                await session.send_to_phone(session.busy_frame("rate_limited", session.rate_limit.retry_after()))
+                trace.finish("rate_limited")
+                continue
+            session.enqueue_turn("phone", message_data, trace)
+
     except WebSocketDisconnect:
-        await manager.disconnect_phone()
+        await session.disconnect_phone(websocket)
     except Exception as e:
         logger.error(f"Phone WebSocket error: {e}")
-        await manager.disconnect_phone()
+        await session.disconnect_phone(websocket)
+
+
+@app.websocket("/ws/phone/audio")
+async def websocket_phone_audio(websocket: WebSocket):
+    """Raw PCM from the phone in, speech_start/speech_end events out.
+
+    Binary frames are 16-bit little-endian mono PCM at ``?rate=`` Hz (default
+    AUDIO_SAMPLE_RATE); events are JSON text frames with times in ms from the
+    start of the stream.
+    """
+    if np is None:
+        logger.warning("🎙️ Audio stream refused: numpy is not installed")
+        await websocket.close(code=1011)
+        return
+    try:
+        sample_rate = int(websocket.query_params.get("rate", AUDIO_SAMPLE_RATE))
+    except ValueError:
+        sample_rate = 0
+    if not 8000 <= sample_rate <= 48000:
+        await websocket.close(code=1003)
+        return
+
+    await websocket.accept()
+    session_id = get_session_id(websocket)
+    vad = VoiceActivityDetector(sample_rate)
+    writer = ConnectionWriter(websocket, f"audio ({session_id})", role="audio")
+    audio_stats["streams"] += 1
+    logger.info(f"🎙️ Audio stream opened at {sample_rate} Hz (session: {session_id})")
+    close_code = None
+    try:
+        while True:
+            pcm = await websocket.receive_bytes()
+            audio_stats["bytes"] += len(pcm)
+            for event in vad.feed(pcm):
+                if event["type"] == "speech_end":
+                    audio_stats["speech_segments"] += 1
+                writer.send(OutboundFrame({**event, "session": session_id}))
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Audio WebSocket error: {e}")
+        close_code = 1011
+    finally:
+        audio_stats["streams"] -= 1
+        await writer.close(close_code)
+        logger.info(f"🎙️ Audio stream closed (session: {session_id})")
+
+
+async def process_cursor_turn(session: Session, message_data: dict, trace: Trace):
+    """Answer a Cursor programming question with Grok.
+
+    Runs on the session's cursor worker, so the receive loop keeps reading
+    (and resolving replies to Grok's own queries) while Grok is busy.
+    """
+    content = message_data.get("content", "")
+    logger.info("Programming question detected, routing to Grok")
+
+    # Send processing indicator
+    await session.send_to_cursor(PROCESSING_FRAME.render(session.get_timestamp()))
+
+    # Get Grok response with smart context
+    with trace.span("context"):
+        smart_context = session.get_smart_context_for_grok()
+    try:
+        with trace.span("upstream", mode="complete"):
+            grok_response = await call_grok_api(content, smart_context, session)
+    except UpstreamBusy as busy:
+        await session.send_to_cursor(session.busy_frame(busy.reason, busy.retry_after))
+        trace.finish("busy")
+        return
+
+    # Create Grok response message
+    grok_message = Message(
+        sender="grok",
+        content=grok_response,
+        message_type="text",
+        timestamp=session.get_timestamp()
+    )
+
+    # Add to knowledge base
+    with trace.span("kb_append", sender="grok"):
+        session.add_to_knowledge_base(grok_message)
+
+    # Send Grok response to cursor
+    with trace.span("send"):
+        await session.send_to_cursor({
+            "type": "message",
+            "sender": "grok",
+            "content": grok_response,
+            "message_type": "text",
+            "timestamp": grok_message.timestamp
+        })
 
 
 @app.websocket("/ws/cursor")
 async def websocket_cursor(websocket: WebSocket):
     """WebSocket endpoint for cursor connection"""
-    await manager.connect_cursor(websocket)
+    subprotocol = negotiate_subprotocol(websocket)
+    try:
+        session = await manager.connect_cursor(websocket, subprotocol)
+    except SessionLimitReached:
+        await manager.refuse(websocket, subprotocol)
+        return
+    session.start_turn_worker("cursor", process_cursor_turn)
+    trace = None
+    sends_reply_to = False  # Once a client tags its replies, untagged messages aren't replies
     try:
         while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            raw = await receive_raw(websocket, subprotocol)
+            trace = Trace("cursor", session.session_id)
+            with trace.span("parse", bytes=len(raw)):
+                message_data = decode_message(raw, subprotocol)
 
             # Create message object
             message = Message(
                 sender="cursor",
                 content=message_data.get("content", ""),
                 message_type=message_data.get("type", "text"),
-                timestamp=manager.get_timestamp()
+                timestamp=session.get_timestamp()
             )
 
             # Add to knowledge base
-            manager.add_to_knowledge_base(message)
+            with trace.span("kb_append", sender="cursor"):
+                analysis = session.add_to_knowledge_base(message)
+
+            # Wake up a Grok query waiting on this reply, which may be on the phone's worker
+            reply_to = message_data.get("reply_to")
+            sends_reply_to = sends_reply_to or reply_to is not None
+            answered = False
+            if reply_to is not None or not sends_reply_to:
+                answered = session.resolve_cursor_query(reply_to, message.content)
+                if not answered and "phone" in session.remote_roles:
+                    session.publish("cursor_reply", query_id=reply_to, content=message.content)
+                    answered = reply_to is not None
 
             # Send cursor message to phone (enabling three-way conversation)
-            await manager.send_to_phone({
+            await session.send_to_phone({
                 "type": "message",
                 "sender": "cursor",
                 "content": message.content,
@@ -582,61 +3541,113 @@ async def websocket_cursor(websocket: WebSocket):
                 "timestamp": message.timestamp
             })
 
-            # Check if it's a programming question and route to Grok
-            if is_programming_question(message.content):
-                logger.info("Programming question detected, routing to Grok")
-
-                # Send processing indicator
-                await manager.send_to_cursor({
-                    "type": "system",
-                    "content": "Processing with Grok AI...",
-                    "timestamp": manager.get_timestamp()
-                })
-
-                # Get Grok response with smart context
-                smart_context = manager.get_smart_context_for_grok()
-                grok_response = await call_grok_api(message.content, smart_context)
-
-                # Create Grok response message
-                grok_message = Message(
-                    sender="grok",
-                    content=grok_response,
-                    message_type="text",
-                    timestamp=manager.get_timestamp()
-                )
-
-                # Add to knowledge base
-                manager.add_to_knowledge_base(grok_message)
-
-                # Send Grok response to cursor
-                await manager.send_to_cursor({
-                    "type": "message",
-                    "sender": "grok",
-                    "content": grok_response,
-                    "message_type": "text",
-                    "timestamp": grok_message.timestamp
-                })
+            # Check if it's a programming question and route to Grok. An answer to
+            # Grok's own query is not a new question, however code-heavy it is
+            if analysis.is_programming and not answered:
+                if not session.rate_limit.take():
+                    ADMISSION_REJECTIONS_TOTAL.inc("session_rate")
+                    await session.send_to_cursor(session.busy_frame("rate_limited", session.rate_limit.retry_after()))
+                    trace.finish("rate_limited")
+                else:
+                    # The worker finishes the trace once Grok has answered
+                    session.enqueue_turn("cursor", message_data, trace)
+                    trace = None
+                continue
+
+            trace.finish()
 
     except WebSocketDisconnect:
-        await manager.disconnect_cursor()
+        await session.disconnect_cursor(websocket)
     except Exception as e:
         logger.error(f"Cursor WebSocket error: {e}")
-        await manager.disconnect_cursor()
+        if trace is not None:
+            trace.finish("error")
+        await session.disconnect_cursor(websocket)
+
+
+HISTORY_PAGE_LIMIT = 1000  # Largest page /history will return in one JSON response
+
+
+async def load_history_page(session_id: str, before: Optional[int], after: Optional[int], limit: int,
+                            sender: Optional[str], message_type: Optional[str]) -> List[dict]:
+    """One page of history from memory, or from the durable log when the page
+    reaches past what memory still holds"""
+    chat_session = manager.find_session(session_id)
+    kb = chat_session.knowledge_base if chat_session else None
+    in_memory = kb is not None and len(kb) > 0 and (
+        (after is not None and after + 1 >= kb.oldest_seq)
+        or (after is None and (before is None or before > kb.oldest_seq))
+    )
+    if in_memory or conversation_store is None:
+        if kb is None:
+            return []
+        rows = [entry.to_dict() for entry in kb.page(before, after, limit, sender, message_type)]
+        # The newest page can be short if older matches were already evicted to the log
+        if conversation_store is None or after is not None or len(rows) >= limit:
+            return rows
+        older = await asyncio.to_thread(
+            conversation_store.fetch, session_id, rows[0]["seq"] if rows else before,
+            None, limit - len(rows), sender, message_type)
+        return older + rows
+    return await asyncio.to_thread(
+        conversation_store.fetch, session_id, before, after, limit, sender, message_type)
+
+
+async def iter_history_ndjson(session_id: str, before: Optional[int], after: Optional[int],
+                              limit: Optional[int], sender: Optional[str],
+                              message_type: Optional[str]) -> AsyncIterator[bytes]:
+    """Yield matching history oldest-first as NDJSON, one page at a time"""
+    sent = 0
+    cursor = after
+    if cursor is None:
+        # Start from the oldest matching row below ``before``
+        cursor = -1
+    while limit is None or sent < limit:
+        page_size = HISTORY_PAGE_LIMIT if limit is None else min(HISTORY_PAGE_LIMIT, limit - sent)
+        rows = await load_history_page(session_id, None, cursor, page_size, sender, message_type)
+        if before is not None:
+            rows = [row for row in rows if row["seq"] < before]
+        if not rows:
+            break
+        for row in rows:
+            yield (encode_json(row) + "\n").encode()
+        sent += len(rows)
+        cursor = rows[-1]["seq"]
+        if len(rows) < page_size:
+            break
 
 
 @app.get("/history")
-async def get_conversation_history():
-    """Get conversation history from knowledge base"""
+async def get_conversation_history(session: str = DEFAULT_SESSION_ID, before: Optional[int] = None,
+                                   after: Optional[int] = None, limit: Optional[int] = None,
+                                   sender: Optional[str] = None,
+                                   message_type: Optional[str] = Query(None, alias="type"),
+                                   output_format: str = Query("json", alias="format")):
+    """Get conversation history from a session's knowledge base.
+
+    Pages are selected by seq id: ``before`` returns the newest page older than
+    it, ``after`` the oldest page newer than it. ``format=ndjson`` streams every
+    matching row instead of returning one page.
+    """
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+
+    if output_format == "ndjson":
+        return StreamingResponse(
+            iter_history_ndjson(session, before, after, limit, sender, message_type),
+            media_type="application/x-ndjson"
+        )
+    if output_format != "json":
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+
+    page_size = min(limit or 100, HISTORY_PAGE_LIMIT)
+    rows = await load_history_page(session, before, after, page_size, sender, message_type)
     return {
-        "messages": [
-            {
-                "sender": msg.sender,
-                "content": msg.content,
-                "message_type": msg.message_type,
-                "timestamp": msg.timestamp
-            }
-            for msg in manager.knowledge_base
-        ]
+        "session": session,
+        "messages": rows,
+        "next_before": rows[0]["seq"] if rows else None,
+        "next_after": rows[-1]["seq"] if rows else None,
+        "has_more": len(rows) == page_size
     }
 
 
@@ -661,12 +3672,15 @@ async def change_model(request: dict):
     CURRENT_GROK_MODEL = new_model
     logger.info(f"🔄 Model changed to: {new_model}")
     
-    # Broadcast model change to all connected clients
-    await manager.broadcast({
+    # Broadcast model change to all connected clients, on every worker
+    notice = {
         "type": "system",
         "content": f"Grok model changed to {GROK_MODELS[new_model]['name']}",
         "timestamp": manager.get_timestamp()
-    })
+    }
+    await manager.broadcast(notice)
+    if backplane.shared:
+        backplane.publish({"kind": "model", "model": new_model, "payload": notice})
     
     return {
         "success": True,
@@ -676,4 +3690,11 @@ async def change_model(request: dict):
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    if THREEWAYCHAT_WORKERS > 1:
+        # Spawned workers import the app by name, so the protocol class must come from that module too
+        module = importlib.import_module("cloud_server")
+        uvicorn.run("cloud_server:app", host="0.0.0.0", port=port, workers=THREEWAYCHAT_WORKERS,
+                    ws=module.DeflateWebSocketProtocol)
+    else:
+        # workers=1 explicitly, or uvicorn falls back to WEB_CONCURRENCY and refuses an app object
+        uvicorn.run(app, host="0.0.0.0", port=port, workers=1, ws=DeflateWebSocketProtocol)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Grok chat completions API
+Speaks the OpenAI-compatible /v1/chat/completions protocol (JSON and SSE
+streaming) with configurable latency, failure injection and [CURSOR_QUERY]
+emission, so cloud_server.py can be exercised offline:
+
+    python mock_grok_server.py --port 8765 --latency lognormal:300,0.5
+    GROK_API_URL=http://localhost:8765/v1/chat/completions GROK_API_KEY=mock python cloud_server.py
+
+The last user message can steer a single request:
+    [mock:status=503]   answer with that HTTP status
+    [mock:delay=2000]   wait that many ms before the first byte
+    [mock:cursor]       ask Cursor (so does any "ask cursor" phrase)
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+DIRECTIVE = re.compile(r"\[mock:(\w+)(?:=([^\]]*))?\]")
+CURSOR_TRIGGER = re.compile(r"\bask cursor\b", re.IGNORECASE)
+FILLER = ("That should sort it out. Check the logs if it happens again, and keep the change small "
+          "so it is easy to review. ").split()
+
+app = FastAPI(title="Mock Grok API")
+config = argparse.Namespace()
+rng = random.Random()
+stats = {"requests": 0, "streams": 0, "injected_errors": 0, "cursor_queries": 0, "dropped_streams": 0}
+
+
+class Latency:
+    """A delay distribution in milliseconds, parsed from e.g. "uniform:20,200"."""
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+        samplers = {
+            "fixed": lambda a: a,
+            "uniform": lambda a, b: rng.uniform(a, b),
+            "normal": lambda mean, sd: rng.gauss(mean, sd),
+            "lognormal": lambda median, sigma: median * rng.lognormvariate(0, sigma),
+            "exp": lambda mean: rng.expovariate(1 / mean) if mean > 0 else 0,
+        }
+        if kind not in samplers:
+            raise ValueError(f"Unknown latency distribution {kind!r}; use one of {', '.join(samplers)}")
+        self.sampler = samplers[kind]
+        self.sample()  # Fail fast on bad parameters
+
+    def sample(self) -> float:
+        """Seconds to wait (never negative)"""
+        return max(self.sampler(*self.params), 0) / 1000
+
+
+def last_user_message(messages: list) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return str(message.get("content", ""))
+    return ""
+
+
+def build_reply(prompt: str, directives: dict) -> str:
+    asked_cursor = "cursor" in directives or CURSOR_TRIGGER.search(prompt) or (
+        config.cursor_query_rate > 0 and rng.random() < config.cursor_query_rate)
+    if asked_cursor and not prompt.startswith("Summarize this Cursor AI response"):
+        stats["cursor_queries"] += 1
+        question = DIRECTIVE.sub("", prompt).strip()[:200]
+        return f"Let me check with Cursor. [CURSOR_QUERY]{question}[/CURSOR_QUERY]"
+    words = f"Mock reply to: {DIRECTIVE.sub('', prompt).strip()[:200]}".split()
+    while len(words) < config.reply_tokens:
+        words.extend(FILLER)
+    return " ".join(words[:max(config.reply_tokens, 1)])
+
+
+def tokens_of(text: str) -> list:
+    return re.findall(r"\s*\S+", text)
+
+
+def error_response(status: int) -> JSONResponse:
+    stats["injected_errors"] += 1
+    headers = {"Retry-After": "1"} if status == 429 else None
+    return JSONResponse(
+        {"error": {"message": f"Injected mock error {status}", "type": "mock_error", "code": status}},
+        status_code=status, headers=headers)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    prompt = last_user_message(body.get("messages", []))
+    directives = {name: value for name, value in DIRECTIVE.findall(prompt)}
+    model = body.get("model", "grok-mock")
+
+    delay = float(directives["delay"]) / 1000 if "delay" in directives else config.latency.sample()
+    await asyncio.sleep(delay)
+
+    if "status" in directives:
+        return error_response(int(directives["status"]))
+    if config.error_rate > 0 and rng.random() < config.error_rate:
+        return error_response(rng.choice(config.error_codes))
+
+    reply = build_reply(prompt, directives)
+    tokens = tokens_of(reply)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+
+    if body.get("stream"):
+        stats["streams"] += 1
+        drop_at = len(tokens) // 2 if config.drop_rate > 0 and rng.random() < config.drop_rate else None
+
+        async def events():
+            for index, token in enumerate(tokens):
+                if index == drop_at:
+                    stats["dropped_streams"] += 1
+                    return  # Connection closes mid-stream without [DONE]
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                         "model": model, "choices": [{"index": 0, "delta": {"content": token},
+                                                      "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(config.token_delay.sample())
+            final = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                     "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # Non-streaming replies still take as long as generating the tokens would
+    await asyncio.sleep(sum(config.token_delay.sample() for _ in tokens))
+    prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in body.get("messages", []))
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                  "total_tokens": prompt_tokens + len(tokens)},
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def configure(args: argparse.Namespace):
+    """Apply parsed options; also handy when mounting the app in a test"""
+    rng.seed(args.seed)
+    config.latency = Latency(args.latency)
+    config.token_delay = Latency(args.token_delay)
+    config.error_rate = args.error_rate
+    config.error_codes = [int(code) for code in args.error_codes.split(",")]
+    config.drop_rate = args.drop_rate
+    config.cursor_query_rate = args.cursor_query_rate
+    config.reply_tokens = args.reply_tokens
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Mock Grok chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:50",
+                        help="Time to first byte: fixed:MS, uniform:LO,HI, normal:MEAN,SD, "
+                             "lognormal:MEDIAN,SIGMA or exp:MEAN")
+    parser.add_argument("--token-delay", default="fixed:10", help="Delay per generated token, same syntax")
+    parser.add_argument("--reply-tokens", type=int, default=40, help="Words in a normal reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-codes", default="429,500,503", help="Statuses injected failures pick from")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of streams cut off halfway")
+    parser.add_argument("--cursor-query-rate", type=float, default=0.0,
+                        help="Fraction of replies that ask Cursor even without a trigger phrase")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+configure(parse_args([]))  # Defaults, so the app also works when imported
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    configure(args)
+    print(f"🧪 Mock Grok API on http://{args.host}:{args.port}/v1/chat/completions")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
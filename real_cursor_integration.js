@@ -103,14 +103,14 @@ class RealCursorIntegration {
             // Also respond to queries from Grok (CURSOR_QUERY tags)
             if (message.type === 'query' && message.sender === 'grok') {
                 console.log('[Real Cursor] Grok is asking for help with:', message.content);
-                this.provideRealCursorResponse(message.content);
+                this.provideRealCursorResponse(message.content, message.query_id || null);
             }
         } catch (error) {
             console.error('[Real Cursor] Error parsing message:', error);
         }
     }
 
-    async provideRealCursorResponse(query) {
+    async provideRealCursorResponse(query, queryId = null) {
         // This is where we'd integrate with the real Cursor AI
         // For now, let's provide intelligent responses based on the actual conversation context
         
@@ -150,7 +150,7 @@ The voice activity detection you implemented is working well. Any specific iOS i
             
             // Handle specific API commands for Companion App
             if (this.currentProject === 'companion-app') {
-                await this.handleCompanionAPICommand(query);
+                await this.handleCompanionAPICommand(query, queryId);
                 return;
             } else if (this.currentProject === 'big-beautiful') {
                 response = `I can help you run functions in your Big Beautiful Program! 
@@ -187,7 +187,7 @@ ${this.currentProject === 'companion-app' ? '📱 "Get contacts", "Check health"
 What would you like me to help with?`;
         }
 
-        await this.sendMessage(response);
+        await this.sendMessage(response, queryId);
         console.log('[Real Cursor] Provided response to Grok');
     }
 
@@ -230,7 +230,7 @@ Currently working on: **${this.projects[this.currentProject].name}**`);
         }
     }
 
-    async handleCompanionAPICommand(query) {
+    async handleCompanionAPICommand(query, queryId = null) {
         const lowerQuery = query.toLowerCase();
         let endpoint = null;
         let parameters = {};
@@ -275,7 +275,7 @@ Currently working on: **${this.projects[this.currentProject].name}**`);
 🗺️ **Geocode**: "geocode address [address]"
 🌐 **Fiber Check**: "check AT&T fiber for [address]"
 
-What would you like me to do?`);
+What would you like me to do?`, queryId);
             return;
         }
         
@@ -316,12 +316,12 @@ What would you like me to do?`);
                         responseMessage += `📊 **Data**: ${JSON.stringify(result.data, null, 2)}`;
                 }
                 
-                this.sendMessage(responseMessage);
+                this.sendMessage(responseMessage, queryId);
             } else {
-                this.sendMessage(`❌ **API Error**: ${result.error}\n\nEndpoint: ${endpoint}`);
+                this.sendMessage(`❌ **API Error**: ${result.error}\n\nEndpoint: ${endpoint}`, queryId);
             }
         } catch (error) {
-            this.sendMessage(`❌ **Unexpected Error**: ${error.message}`);
+            this.sendMessage(`❌ **Unexpected Error**: ${error.message}`, queryId);
         }
     }
 
@@ -417,7 +417,7 @@ What would you like me to do?`);
         }
     }
 
-    async sendMessage(content) {
+    async sendMessage(content, replyTo = null) {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
             const message = {
                 content: content,
@@ -425,6 +425,11 @@ What would you like me to do?`);
                 sender: 'cursor'
             };
             
+            // Echo the Grok query id so the server can match this reply to its query
+            if (replyTo) {
+                message.reply_to = replyTo;
+            }
+            
             this.ws.send(JSON.stringify(message));
             console.log('[Real Cursor] Sent response');
         } else {
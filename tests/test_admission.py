@@ -0,0 +1,153 @@
+"""UpstreamLimiter, SingleFlight and TokenBucket from cloud_server.py"""
+
+import asyncio
+
+import pytest
+
+import cloud_server as cs
+
+
+async def hold(limiter: cs.UpstreamLimiter, seconds: float, log: list, name: str):
+    try:
+        async with limiter.slot("test"):
+            log.append(name)
+            await asyncio.sleep(seconds)
+    except cs.UpstreamBusy as busy:
+        log.append(f"{name}:{busy.reason}")
+
+
+def test_limiter_admits_waiters_in_fifo_order():
+    async def run():
+        limiter = cs.UpstreamLimiter(limit=1, queue_size=5, timeout=5)
+        log = []
+        await asyncio.gather(*(hold(limiter, 0.01, log, name) for name in "abcd"))
+        return limiter, log
+
+    limiter, log = asyncio.run(run())
+    assert log == ["a", "b", "c", "d"]
+    assert limiter.in_flight == 0 and not limiter.waiters
+    assert limiter.stats()["queued"] == 3
+
+
+def test_limiter_sheds_when_queue_is_full():
+    async def run():
+        limiter = cs.UpstreamLimiter(limit=1, queue_size=1, timeout=5)
+        log = []
+        await asyncio.gather(hold(limiter, 0.05, log, "a"), hold(limiter, 0, log, "b"), hold(limiter, 0, log, "c"))
+        return limiter, log
+
+    limiter, log = asyncio.run(run())
+    assert log == ["a", "c:queue_full", "b"]
+    assert limiter.rejected == {"queue_full": 1, "queue_timeout": 0}
+    assert limiter.in_flight == 0
+
+
+def test_limiter_times_out_queued_calls():
+    async def run():
+        limiter = cs.UpstreamLimiter(limit=1, queue_size=5, timeout=0.02)
+        log = []
+        await asyncio.gather(hold(limiter, 0.2, log, "a"), hold(limiter, 0, log, "b"))
+        return limiter, log
+
+    limiter, log = asyncio.run(run())
+    assert log == ["a", "b:queue_timeout"]
+    assert limiter.rejected["queue_timeout"] == 1
+    assert limiter.in_flight == 0 and not limiter.waiters
+
+
+def test_limiter_cancelled_waiter_leaves_queue():
+    async def run():
+        limiter = cs.UpstreamLimiter(limit=1, queue_size=5, timeout=5)
+        log = []
+        first = asyncio.create_task(hold(limiter, 0.05, log, "a"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(hold(limiter, 0, log, "b"))
+        await asyncio.sleep(0.01)
+        assert len(limiter.waiters) == 1
+        second.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+        # The slot is free again, not leaked to the cancelled waiter
+        await hold(limiter, 0, log, "c")
+        return limiter, log
+
+    limiter, log = asyncio.run(run())
+    assert log == ["a", "c"]
+    assert limiter.in_flight == 0 and not limiter.waiters
+
+
+def test_limiter_zero_limit_is_unlimited():
+    async def run():
+        limiter = cs.UpstreamLimiter(limit=0, queue_size=0, timeout=0.01)
+        log = []
+        await asyncio.gather(*(hold(limiter, 0.01, log, str(i)) for i in range(20)))
+        return limiter, log
+
+    limiter, log = asyncio.run(run())
+    assert len(log) == 20 and limiter.rejected == {"queue_full": 0, "queue_timeout": 0}
+
+
+def test_single_flight_coalesces_identical_calls():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def run():
+        flights = cs.SingleFlight()
+        results = await asyncio.gather(*(flights.run("key", fetch) for _ in range(5)))
+        return flights, results
+
+    flights, results = asyncio.run(run())
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert flights.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 4}
+
+
+def test_single_flight_survives_one_caller_cancelling():
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def run():
+        flights = cs.SingleFlight()
+        first = asyncio.create_task(flights.run("key", fetch))
+        second = asyncio.create_task(flights.run("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "answer"
+
+
+def test_single_flight_cancels_task_when_every_caller_leaves():
+    cancelled = []
+
+    async def fetch():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        flights = cs.SingleFlight()
+        caller = asyncio.create_task(flights.run("key", fetch))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await asyncio.sleep(0)
+        return flights
+
+    flights = asyncio.run(run())
+    assert cancelled == [True]
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_token_bucket_burst_then_retry_after():
+    bucket = cs.TokenBucket(rate=1, burst=2)
+    assert [bucket.take() for _ in range(3)] == [True, True, False]
+    assert 0 < bucket.retry_after() <= 1
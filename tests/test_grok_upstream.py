@@ -0,0 +1,157 @@
+"""The Grok upstream path of cloud_server.py against mock_grok_server.py over real HTTP"""
+
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+from fastapi.testclient import TestClient
+
+import cloud_server as cs
+import mock_grok_server as mock
+
+APOLOGY = "Sorry, there was an error processing your request."
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def mock_url():
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(mock.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "mock Grok server did not start"
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}/v1/chat/completions"
+    server.should_exit = True
+    thread.join(5)
+
+
+@pytest.fixture
+def upstream(monkeypatch, mock_url):
+    """Point cloud_server at the mock with a fresh cache; returns a function to reconfigure the mock"""
+    monkeypatch.setattr(cs, "GROK_API_URL", mock_url)
+    monkeypatch.setattr(cs, "GROK_API_KEY", "mock")
+    monkeypatch.setattr(cs, "GROK_CACHE_ENABLED", True)
+    monkeypatch.setattr(cs, "grok_cache", cs.ResponseCache())
+    monkeypatch.setattr(cs, "CONVERSATION_DB_PATH", "")
+
+    def configure(*argv: str):
+        mock.configure(mock.parse_args(["--latency", "fixed:0", "--token-delay", "fixed:0", *argv]))
+
+    configure()
+    yield configure
+    configure()
+
+
+def run(factory):
+    """Run a coroutine on a fresh loop, closing the shared HTTP session it opened"""
+    async def main():
+        try:
+            return await factory()
+        finally:
+            if cs.http_session is not None:
+                await cs.http_session.close()
+                cs.http_session = None
+    return asyncio.run(main())
+
+
+async def collect_stream(message: str) -> str:
+    return "".join([delta async for delta in cs.stream_grok_api(message)])
+
+
+def test_completion_succeeds_and_is_cached(upstream):
+    requests = mock.stats["requests"]
+    first = run(lambda: cs.call_grok_api("What is a closure?"))
+    second = run(lambda: cs.call_grok_api("what is a closure"))
+    assert first.startswith("Mock reply to: What is a closure?")
+    assert second == first
+    assert mock.stats["requests"] == requests + 1
+    assert cs.grok_cache.hits == 1
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_injected_error_is_an_apology_and_never_cached(upstream, status):
+    requests = mock.stats["requests"]
+    message = f"[mock:status={status}] What is a closure?"
+    assert run(lambda: cs.call_grok_api(message)) == APOLOGY
+    assert run(lambda: cs.call_grok_api(message)) == APOLOGY
+    assert mock.stats["requests"] == requests + 2
+    assert len(cs.grok_cache.entries) == 0
+
+
+def test_stream_succeeds_and_is_cached(upstream):
+    requests = mock.stats["requests"]
+    streamed = run(lambda: collect_stream("Explain async generators"))
+    assert streamed.startswith("Mock reply to: Explain async generators")
+    assert run(lambda: collect_stream("explain async generators")) == streamed.strip()
+    assert mock.stats["requests"] == requests + 1
+
+
+def test_stream_dropped_midway_is_not_cached(upstream):
+    upstream("--drop-rate", "1")
+    requests, dropped = mock.stats["requests"], mock.stats["dropped_streams"]
+    first = run(lambda: collect_stream("Explain async generators"))
+    second = run(lambda: collect_stream("Explain async generators"))
+    assert first and second == first  # The partial text is still relayed
+    assert mock.stats["requests"] == requests + 2
+    assert mock.stats["dropped_streams"] == dropped + 2
+    assert len(cs.grok_cache.entries) == 0
+
+
+def receive_until(ws, wanted) -> dict:
+    while True:
+        frame = ws.receive_json()
+        if wanted(frame):
+            return frame
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_cursor_query_round_trip(upstream, stream):
+    with TestClient(cs.app) as client:
+        session = f"cursor-query-{stream}"
+        with client.websocket_connect(f"/ws/phone?session={session}") as phone, \
+                client.websocket_connect(f"/ws/cursor?session={session}") as cursor:
+            phone.receive_json()
+            cursor.receive_json()
+            phone.send_json({"type": "text", "content": "Why is my counter wrong? [mock:cursor]", "stream": stream})
+
+            query = receive_until(cursor, lambda frame: frame.get("type") == "query")
+            assert query["sender"] == "grok" and query["query_id"]
+            assert "Why is my counter wrong?" in query["content"]
+            cursor.send_json({"type": "text", "content": "Use a lock around the counter.",
+                              "reply_to": query["query_id"]})
+
+            final_type = "message_end" if stream else "message"
+            final = receive_until(phone, lambda frame: frame.get("type") == final_type
+                                  and frame.get("sender") == "grok")
+            assert "Summarize this Cursor AI response" in final["content"]
+            assert "Use a lock around the counter." in final["content"]
+            assert "[CURSOR_QUERY]" not in final["content"]
+
+
+def test_pool_stats_count_requests_and_reused_connections(upstream):
+    opened, reused = cs.upstream_pool_stats["opened"], cs.upstream_pool_stats["reused"]
+
+    async def two_calls():
+        await cs.call_grok_api("What is a closure?")
+        during = []
+        async for _ in cs.stream_grok_api("Explain async generators"):
+            during.append(cs.get_upstream_pool_stats()["in_use"])
+        return during
+
+    during = run(two_calls)
+    stats = cs.get_upstream_pool_stats()
+    assert during and set(during) == {1}
+    assert stats["in_use"] == 0 and not stats["open"]
+    assert cs.upstream_pool_stats["opened"] == opened + 1
+    assert cs.upstream_pool_stats["reused"] == reused + 1
@@ -0,0 +1,92 @@
+"""KnowledgeBase paging and seqs, and Cursor query correlation, from cloud_server.py"""
+
+import asyncio
+
+import cloud_server as cs
+
+
+def filled(count: int, **kwargs) -> cs.KnowledgeBase:
+    kb = cs.KnowledgeBase(max_age=0, **kwargs)
+    for i in range(count):
+        sender = ("phone", "grok", "cursor")[i % 3]
+        kb.append(cs.Message(sender=sender, content=f"message {i}", message_type="voice" if i % 2 else "text"))
+    return kb
+
+
+def seqs(entries) -> list:
+    return [entry.seq for entry in entries]
+
+
+def test_page_defaults_to_newest_entries_oldest_first():
+    kb = filled(10)
+    assert seqs(kb.page(limit=3)) == [7, 8, 9]
+
+
+def test_page_before_and_after():
+    kb = filled(10)
+    assert seqs(kb.page(before=5, limit=3)) == [2, 3, 4]
+    assert seqs(kb.page(after=5, limit=3)) == [6, 7, 8]
+    assert seqs(kb.page(after=2, before=6, limit=10)) == [3, 4, 5]
+    assert kb.page(after=9) == []
+
+
+def test_page_filters_by_sender_and_type():
+    kb = filled(12)
+    assert seqs(kb.page(sender="grok", limit=10)) == [1, 4, 7, 10]
+    assert seqs(kb.page(sender="phone", message_type="voice", limit=10)) == [3, 9]
+    assert seqs(kb.page(sender="cursor", after=2, limit=2)) == [5, 8]
+
+
+def test_page_only_sees_retained_entries():
+    kb = filled(10, max_entries=4)
+    assert kb.oldest_seq == 6 and kb.evicted == 6
+    assert seqs(kb.page(before=8, limit=10)) == [6, 7]
+    assert seqs(kb.page(after=0, limit=2)) == [6, 7]
+
+
+def test_append_jumps_to_a_later_seq_but_never_back():
+    kb = filled(3)
+    assert kb.append(cs.Message(sender="phone", content="remote"), seq=10).seq == 10
+    assert kb.append(cs.Message(sender="phone", content="stale"), seq=4).seq == 11
+    assert kb.append(cs.Message(sender="phone", content="local")).seq == 12
+
+
+def test_expire_drops_old_entries():
+    kb = cs.KnowledgeBase(max_age=60)
+    kb.append(cs.Message(sender="phone", content="old", timestamp="2000-01-01T00:00:00"))
+    kb.append(cs.Message(sender="phone", content="new"))
+    assert [entry.content for entry in kb] == ["new"]
+
+
+def test_resolve_cursor_query_by_id():
+    async def run():
+        session = cs.Session("resolve-by-id")
+        first_id, first = session.register_cursor_query()
+        second_id, second = session.register_cursor_query()
+        assert session.resolve_cursor_query(second_id, "two")
+        assert not session.resolve_cursor_query(second_id, "again")
+        assert not session.resolve_cursor_query("unknown", "stray")
+        return first, second, session
+
+    first, second, session = asyncio.run(run())
+    assert second.result() == "two"
+    assert not first.done()
+    assert list(session.pending_cursor_queries) != []
+
+
+def test_resolve_cursor_query_without_id_takes_oldest():
+    async def run():
+        session = cs.Session("resolve-oldest")
+        _, first = session.register_cursor_query()
+        _, second = session.register_cursor_query()
+        assert session.resolve_cursor_query(None, "one")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.result() == "one"
+    assert not second.done()
+
+
+def test_resolve_cursor_query_with_nothing_pending():
+    session = cs.Session("resolve-none")
+    assert not session.resolve_cursor_query(None, "hello")
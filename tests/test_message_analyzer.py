@@ -0,0 +1,38 @@
+"""analyze_message against the plain substring scans it replaced"""
+
+import random
+
+import cloud_server as cs
+
+FRAGMENTS = sorted({word for words in cs.ANALYZER_KEYWORDS.values() for word in words}) + [
+    "de", "bug", "buggy", "debugger", "API", "Class", "pro", "gram", "three", "way", "can", "you",
+    "companion", "app", "big", "beautiful", "hello", "there", "x", "_", "()", "{", "};", "?", "!",
+    "SQL", "JavaScript", "HOW", "Why?", "fixed.", "unresolved", "servers", "data", "structure",
+]
+SEPARATORS = [" ", " ", " ", "", "\n", "\t", "  ", ".", "-"]
+
+
+def legacy_categories(content: str) -> set:
+    content_lower = content.lower()
+    return {category for category, words in cs.ANALYZER_KEYWORDS.items()
+            if any(word in content_lower for word in words)}
+
+
+def random_message(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(0, 30)):
+        parts.append(rng.choice(FRAGMENTS))
+        parts.append(rng.choice(SEPARATORS))
+    return "".join(parts)
+
+
+def test_analyze_message_matches_substring_scans():
+    rng = random.Random(13)
+    for _ in range(3000):
+        content = random_message(rng)
+        expected = legacy_categories(content)
+        analysis = cs.analyze_message(content)
+        found = cs.MessageAnalysis(expected, [])
+        for name in ("intent", "is_question", "is_debugging", "is_solved", "is_programming",
+                     "projects", "companion_api"):
+            assert getattr(analysis, name) == getattr(found, name), (name, content)
@@ -0,0 +1,53 @@
+"""The per-session phone turn queue and barge-in from cloud_server.py"""
+
+import asyncio
+
+import cloud_server as cs
+
+
+def test_barge_in_cancels_turn_and_supersedes_queued_utterances():
+    started = []
+
+    async def process_turn(session, message_data, trace):
+        started.append(message_data["content"])
+        await asyncio.sleep(1)
+
+    async def run():
+        session = cs.Session("barge-in")
+        session.start_turn_worker("phone", process_turn)
+        traces = [cs.Trace("phone", session.session_id) for _ in range(4)]
+        session.enqueue_turn("phone", {"content": "first"}, traces[0])
+        await asyncio.sleep(0.01)
+        # Queued behind "first" without barging in, as if they arrived together
+        session.turn_workers["phone"].queue.put_nowait(({"content": "second"}, traces[1], 0.0))
+        session.turn_workers["phone"].queue.put_nowait(({"content": "third"}, traces[2], 0.0))
+        session.enqueue_turn("phone", {"content": "fourth"}, traces[3])
+        await asyncio.sleep(0.01)
+        await session.stop_turn_worker("phone")
+        return traces
+
+    traces = asyncio.run(run())
+    assert started == ["first", "fourth"]
+    assert [trace.outcome for trace in traces] == ["cancelled", "superseded", "superseded", "cancelled"]
+
+
+def test_cursor_turns_run_in_order_without_barge_in():
+    started = []
+
+    async def process_turn(session, message_data, trace):
+        started.append(message_data["content"])
+        await asyncio.sleep(0.01)
+
+    async def run():
+        session = cs.Session("cursor-turns")
+        session.start_turn_worker("cursor", process_turn)
+        traces = [cs.Trace("cursor", session.session_id) for _ in range(3)]
+        for index, trace in enumerate(traces):
+            session.enqueue_turn("cursor", {"content": f"question {index}"}, trace)
+        await asyncio.sleep(0.1)
+        await session.stop_turn_worker("cursor")
+        return traces
+
+    traces = asyncio.run(run())
+    assert started == ["question 0", "question 1", "question 2"]
+    assert [trace.outcome for trace in traces] == ["ok", "ok", "ok"]
@@ -0,0 +1,45 @@
+"""ResponseCache keys from cloud_server.py"""
+
+import pytest
+
+import cloud_server as cs
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Как дела?", "Где мой заказ?"),
+    ("what is 2+2", "what is 2-2"),
+    ("is x < 3", "is x > 3"),
+    ("what does a && b do", "what does a || b do"),
+    ("東京の天気は？", "大阪の天気は？"),
+])
+def test_different_questions_get_different_keys(first, second):
+    assert cs.normalize_for_cache(first) != cs.normalize_for_cache(second)
+    assert cs.grok_cache.key_for(first, None) != cs.grok_cache.key_for(second, None)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("What is a closure?", "what is a closure"),
+    ("  what   is\ta closure ", "What is a closure..."),
+    ("Как дела?", "как дела"),
+])
+def test_trivial_variants_share_a_key(first, second):
+    assert cs.normalize_for_cache(first) == cs.normalize_for_cache(second)
+
+
+def conversation(session_id: str, *turns: str) -> cs.Session:
+    session = cs.Session(session_id)
+    for index, content in enumerate(turns):
+        session.knowledge_base.append(cs.Message(sender="grok" if index % 2 else "phone", content=content))
+    return session
+
+
+def test_follow_ups_on_different_topics_get_different_keys():
+    sharks = conversation("shared", "How fast can sharks swim?", "Makos reach about 70 km/h.", "Tell me more.")
+    bread = conversation("shared", "How do I bake sourdough bread?", "Start with a lively starter.", "tell me more")
+    assert cs.grok_cache.key_for("Tell me more.", sharks) != cs.grok_cache.key_for("tell me more", bread)
+
+
+def test_same_question_after_same_turns_shares_a_key():
+    first = conversation("same", "How fast can sharks swim?", "Makos reach about 70 km/h.", "Tell me more.")
+    second = conversation("same", "How fast can sharks swim?", "Makos reach about 70 km/h.", "tell me more")
+    assert cs.grok_cache.key_for("Tell me more.", first) == cs.grok_cache.key_for("tell me more", second)
@@ -0,0 +1,46 @@
+"""The ConnectionManager session registry from cloud_server.py"""
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import cloud_server as cs
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    registry = cs.ConnectionManager()
+    monkeypatch.setattr(cs, "manager", registry)
+    monkeypatch.setattr(cs, "MAX_SESSIONS", 2)
+    monkeypatch.setattr(cs, "CONVERSATION_DB_PATH", "")
+    return registry
+
+
+def test_full_registry_prunes_idle_sessions(manager):
+    manager.get_session("a")
+    manager.get_session("b")
+    manager.get_session("c")
+    assert list(manager.sessions) == ["c"]
+
+
+def test_full_registry_without_idle_sessions_refuses(manager):
+    for session_id in ("a", "b"):
+        manager.get_session(session_id).phone_connection = object()
+    with pytest.raises(cs.SessionLimitReached):
+        manager.get_session("c")
+    assert list(manager.sessions) == ["a", "b"]
+    assert manager.get_session("a") is manager.sessions["a"]  # Existing sessions still resolve
+
+
+def test_websocket_over_the_limit_closes_with_1013(manager):
+    with TestClient(cs.app) as client:
+        with client.websocket_connect("/ws/phone?session=a") as first, \
+                client.websocket_connect("/ws/cursor?session=b") as second:
+            first.receive_json()
+            second.receive_json()
+            for path in ("/ws/phone?session=c", "/ws/cursor?session=c"):
+                with client.websocket_connect(path) as refused:
+                    with pytest.raises(WebSocketDisconnect) as closed:
+                        refused.receive_json()
+                    assert closed.value.code == 1013
+            assert "c" not in manager.sessions
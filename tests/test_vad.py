@@ -0,0 +1,31 @@
+"""VoiceActivityDetector from cloud_server.py"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import cloud_server as cs  # noqa: E402
+from bench_vad import synthetic_sample  # noqa: E402
+
+
+def feed_all(pcm: bytes, rate: int, sizes) -> list:
+    vad = cs.VoiceActivityDetector(rate)
+    events, offset, index = [], 0, 0
+    while offset < len(pcm):
+        size = sizes[index % len(sizes)]
+        events.extend(vad.feed(pcm[offset:offset + size]))
+        offset += size
+        index += 1
+    return events
+
+
+def test_detects_voiced_bursts():
+    pcm, rate = synthetic_sample(6)
+    events = feed_all(pcm, rate, [rate * 2 // 50])
+    assert [event["type"] for event in events] == ["speech_start", "speech_end"] * 2
+
+
+def test_odd_length_chunks_give_the_same_events():
+    pcm, rate = synthetic_sample(6)
+    expected = feed_all(pcm, rate, [640])
+    assert feed_all(pcm, rate, [641, 333, 1, 1023]) == expected